@@ -0,0 +1,71 @@
+#! /usr/bin/env python
+'''\
+Show that queue_matrix.toMatrix() memory stays bounded as its input grows.
+
+Writes synthetic feed_graphite() logs of increasing length and reports
+peak (traced) memory and run time of converting each one.
+'''
+
+import os
+import argparse
+import tempfile
+import time
+import tracemalloc
+import random
+
+from daflsim import queue_matrix
+
+
+def writeLog(fname, numQueues, numTimes, interval=60):
+    with open(fname, 'w') as f:
+        for t in range(numTimes):
+            f.writelines('dataq.host.q%04d,%d,%d\n'
+                         % (q, t*interval, random.randint(0, 3))
+                         for q in range(numQueues))
+
+
+def convert(fname):
+    with open(os.devnull, 'w') as out:
+        queue_matrix.toMatrix(open(fname), out)
+
+def measure(fname):
+    'Time an untraced run, then trace memory of a second run.'
+    tic = time.time()
+    convert(fname)
+    elapsed = time.time() - tic
+    tracemalloc.start()
+    convert(fname)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Memory/time of queue_matrix.toMatrix vs input size',
+        epilog='EXAMPLE: %(prog)s --queues 50 --times 1000 10000 100000'
+        )
+    parser.add_argument('--queues', type=int, default=50,
+                        help='Number of queues (matrix columns)')
+    parser.add_argument('times', type=int, nargs='*',
+                        default=[1000, 10000, 40000],
+                        help='Number of time steps (matrix rows) per run')
+    args = parser.parse_args()
+
+    print('%10s %10s %10s %10s %8s'
+          % ('Lines', 'Input(MB)', 'Peak(MB)', 'Seconds', 'Lines/s'))
+    for numTimes in args.times:
+        fd, fname = tempfile.mkstemp(suffix='.graphite')
+        os.close(fd)
+        try:
+            writeLog(fname, args.queues, numTimes)
+            lines = args.queues * numTimes
+            peak, elapsed = measure(fname)
+            print('%10d %10.1f %10.1f %10.2f %8.0f'
+                  % (lines, os.path.getsize(fname)/1e6, peak/1e6,
+                     elapsed, lines/elapsed))
+        finally:
+            os.remove(fname)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#! /usr/bin/env python
+'''\
+Show how the simulator scales with graph size and simulated horizon.
+
+For every (sites, horizon) pair, generates a synthetic graph (see
+daflsim/synth.py) and reports setupDataflowNetwork() time, events
+processed per second by the run, and peak (traced) memory of a second,
+traced, setup and run.
+'''
+
+import sys
+import os
+import argparse
+import tempfile
+import time
+import tracemalloc
+
+import simpy
+
+from daflsim import daflsim
+from daflsim import synth
+
+
+def simulate(fname, end):
+    'Returns (setup seconds, run seconds, events).'
+    tic = time.time()
+    env = simpy.Environment()
+    daflsim.setupDataflowNetwork(env, fname, cachedir=None)
+    setup = time.time() - tic
+
+    tic = time.time()
+    events = 0
+    while env.peek() < end:
+        env.step()
+        events += 1
+    return setup, time.time() - tic, events
+
+def measure(fname, end):
+    'Time an untraced run, then trace memory of a second run.'
+    setup, elapsed, events = simulate(fname, end)
+    tracemalloc.start()
+    simulate(fname, end)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return setup, elapsed, events, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Setup time, events/sec and memory vs graph size'
+        ' and horizon',
+        epilog='EXAMPLE: %(prog)s --sites 10 100 1000 --ends 1e4 1e5'
+        )
+    parser.add_argument('--sites', type=int, nargs='+',
+                        default=[10, 100, 1000],
+                        help='Graph sizes (number of instrument sites)')
+    parser.add_argument('--archives', type=int, default=4,
+                        help='Number of archive hosts [default=%(default)s]')
+    parser.add_argument('--ends', type=float, nargs='+', default=[1e4, 1e5],
+                        help='Simulated horizons (seconds)')
+    parser.add_argument('--count', type=int, default=1000,
+                        help='Records emitted per instrument'
+                        ' [default=%(default)s]')
+    args = parser.parse_args()
+
+    print('%6s %6s %9s %9s %9s %10s %10s %9s'
+          % ('Sites', 'Nodes', 'End', 'Setup(s)', 'Run(s)', 'Events',
+             'Events/s', 'Peak(MB)'))
+    for sites in args.sites:
+        fd, fname = tempfile.mkstemp(suffix='.dot')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                synth.synthDataflow(sites, archives=args.archives,
+                                    count=args.count, outfile=f)
+            for end in args.ends:
+                setup, elapsed, events, peak = measure(fname, end)
+                print('%6d %6d %9g %9.2f %9.2f %10d %10.0f %9.1f'
+                      % (sites, 8*sites + 6*args.archives + 1, end,
+                         setup, elapsed, events,
+                         events/elapsed if elapsed > 0 else 0,
+                         peak/1e6))
+                sys.stdout.flush()
+        finally:
+            os.remove(fname)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+'''\
+Static analysis of a dataflow graph, before (or instead of) simulating.
+
+  - Throughput bound: maximum flow (messages/second) from the sources to
+    the sinks.  Each action is split into in/out nodes joined by an edge
+    of its service rate (see analytic.serviceTime); sources are limited
+    to their emit rate, queues and pipes are not limited.  The minimum
+    cut names the bottleneck actions (or sources, if nothing else
+    limits).  Copies sent to several outputs are not counted twice, so
+    this bounds the rate of distinct messages reaching the sinks.
+  - Host load: CPU seconds per second a host needs if every action on
+    it runs on every cron tick (mean delay / cron interval), against
+    its cores (host_cores, default_cores).
+  - Reachability: queues no source can reach never receive data.
+Reachability and host load are linear in the graph size and checked on
+every run; max flow takes about a second on 10000 nodes, so is only
+computed when it will be shown.
+'''
+
+import logging
+
+import networkx as nx
+
+from daflsim import analytic
+from daflsim import delays
+
+
+def unreachableQueues(G):
+    'Queues (and terminals) of G that no source feeds.'
+    plan = G.graph['plan']
+    types = plan['types']
+    seen = [t == 's' for t in types]
+    stack = [i for i in range(len(types)) if seen[i]]
+    edges = plan['edges']
+    while stack:
+        i = stack.pop()
+        for j in plan['outEdges'][i]:
+            v = edges[j][1]
+            if not seen[v]:
+                seen[v] = True
+                stack.append(v)
+    return [plan['nodes'][i] for i in range(len(types))
+            if types[i] in ('q', 't') and not seen[i]]
+
+
+def hostLoad(G, cfg):
+    '''Returns load[host] = (busy cores if every action runs every tick,
+cores or None if unlimited).'''
+    load = dict()
+    for n, d in G.nodes_iter(data=True):
+        if d['type'] != 'a':
+            continue
+        delay = delays.Delay(d.get('delay', cfg['action_delay'])).mean()
+        busy = delay / analytic.cronInterval(d.get('cron', '* *'))
+        host = d['host']
+        cores = cfg.get('host_cores', {}).get(host, cfg.get('default_cores'))
+        total = load[host][0] if host in load else 0.0
+        load[host] = (total + busy, None if cores == None else int(cores))
+    return load
+
+
+def maxFlow(G, cfg):
+    '''Returns (messages/second, bottleneck node names) from max-flow/min-cut
+of sources to sinks.  Rate is inf if some path has no limit.'''
+    plan = G.graph['plan']
+    nodes = plan['nodes']
+    types = plan['types']
+    F = nx.DiGraph()
+    F.add_node('_sources')
+    F.add_node('_sinks')
+    def head(i):
+        return (nodes[i], 'in') if types[i] == 'a' else nodes[i]
+    def tail(i):
+        return (nodes[i], 'out') if types[i] == 'a' else nodes[i]
+    for i, n in enumerate(nodes):
+        d = G.node[n]
+        if types[i] == 's':
+            F.add_edge('_sources', n, capacity=analytic.sourceRate(d, cfg))
+        elif types[i] == 'a':
+            service, giveUp = analytic.serviceTime(d, cfg)
+            F.add_edge((n, 'in'), (n, 'out'), capacity=1.0 / service)
+    for (u, v, etype) in plan['edges']:
+        F.add_edge(tail(u), head(v))
+    for i in plan['sinks']:
+        F.add_edge(nodes[i], '_sinks')
+    try:
+        value, (reach, rest) = nx.minimum_cut(F, '_sources', '_sinks')
+    except nx.NetworkXUnbounded:
+        return float('inf'), []
+    bottlenecks = []
+    for u in reach:
+        for v in F.succ[u]:
+            if v in reach:
+                continue
+            if u == '_sources':
+                bottlenecks.append(v) # source limited by its own rate
+            else:
+                (name, side) = u # the (action, 'in') node of a cut action
+                bottlenecks.append(name)
+    return value, sorted(bottlenecks)
+
+
+def analyzeGraph(G, cfg, withFlow=True):
+    '''Returns dict(flow=, bottlenecks=, hosts=, unreachable=) of graph G.
+FLOW is None unless WITHFLOW.'''
+    flow, bottlenecks = maxFlow(G, cfg) if withFlow else (None, [])
+    return dict(flow=flow, bottlenecks=bottlenecks, hosts=hostLoad(G, cfg),
+                unreachable=unreachableQueues(G))
+
+
+def overloadedHosts(result):
+    'Hosts of RESULT whose load exceeds their cores: [(host, load, cores)].'
+    return [(host, load, cores)
+            for host, (load, cores) in sorted(result['hosts'].items())
+            if cores != None and load > cores]
+
+
+def logAnalysis(result):
+    hours = 60*60
+    if result['flow'] is not None:
+        logging.info('Max flow to sinks: %.2f messages/hour; bottlenecks: %s',
+                     result['flow'] * hours, ', '.join(result['bottlenecks']))
+    for host, load, cores in overloadedHosts(result):
+        logging.warning('Host %s may be overloaded: %.2f busy cores of %d',
+                        host, load, cores)
+    for n in result['unreachable']:
+        logging.warning('Queue "%s" is not reachable from any source'
+                        ' (it will never receive data)', n)
+
+
+def printReport(result, file=None):
+    hours = 60*60
+    print('#'*55, file=file)
+    print('Static analysis:', file=file)
+    print('  Max flow to sinks: %.2f messages/hour' % (result['flow'] * hours),
+          file=file)
+    print('  Bottlenecks (min cut): %s' % ', '.join(result['bottlenecks']),
+          file=file)
+    print('  %15s %10s %6s' % ('Host', 'Load', 'Cores'), file=file)
+    for host, (load, cores) in sorted(result['hosts'].items()):
+        print('  %15s %10.3f %6s %s'
+              % (host, load, '-' if cores == None else cores,
+                 'OVERLOADED' if cores != None and load > cores else ''),
+              file=file)
+    for host, load, cores in overloadedHosts(result):
+        print('  WARNING: host %s may be overloaded: %.2f busy cores of %d'
+              % (host, load, cores), file=file)
+    for n in result['unreachable']:
+        print('  WARNING: unreachable queue %s' % (n,), file=file)
@@ -0,0 +1,232 @@
+'''\
+Analytic (queueing network) estimate of a dataflow graph, without
+simulating it.  Good for screening configurations before running them.
+
+Every action is a server taking one message per cron cycle.  Its service
+time is its expected busy time per message (action delay times expected
+attempts, plus retry backoffs), rounded up to whole cron intervals.
+Offered rates follow the Jackson traffic equations
+
+    lam = gamma + P^T lam
+
+where GAMMA is the rate of each source (1/mean image delay, or the mean
+rate of its trace; sources are taken to emit forever, COUNT is ignored)
+and P[u,v] the fraction of u's messages that reach v.
+An action sends every result to all its outputs (failures to its
+"on_fail" output only).  A queue read by several actions splits its
+messages among them.  An all-of join of K inputs emits one message per
+K inputs.  The equations are solved directly (a linear solve).  Data
+that reaches a loop it goes around forever (one that passes on at least
+as many messages as it takes in) makes the rates of the loop, and of
+everything after it, inf; those nodes are left out of the solve.
+
+Queue utilization is RHO = lam / (service rate of its readers).  Expected
+depth is RHO/(1-RHO), as for an M/M/1 queue.  Queues with RHO >= 1 are
+unstable: they grow without bound in a long enough run, and the rates
+after them are offered, not achieved.
+'''
+
+import csv
+import logging
+import math
+
+import numpy as np
+import networkx as nx
+
+from daflsim import cron
+from daflsim import delays
+from daflsim import traces
+
+
+def cronInterval(cronStr):
+    'Mean seconds between firings of cron spec CRONSTR.'
+    schedule = cron.schedule(cronStr)
+    period = schedule.period * 60
+    ticks = set((m*60 + wait) % period
+                for (m, wait) in enumerate(schedule.table))
+    return period / len(ticks)
+
+def sourceRate(d, cfg):
+    'Messages per second emitted by source node (attributes D).'
+    if 'trace' in d:
+        count = 0
+        span = 0.0
+        for (span, name, size) in traces.readTrace(d['trace']):
+            count += 1
+        return count / span if span > 0 else 0.0
+    mean = delays.Delay(d.get('delay', cfg['image_delay'])).mean()
+    return 1.0 / mean if mean > 0 else float('inf')
+
+def serviceTime(d, cfg):
+    '''Expected seconds per message of action node (attributes D), and
+probability it gives up on a message.'''
+    probFail = float(d.get('probFail',
+                           cfg.get('action_prob_fail', {}).get(
+                               d['action'], cfg.get('prob_fail', 0.0))))
+    retries = int(d.get('retries', cfg.get('retries', 0)))
+    backoff = float(d.get('backoff', cfg.get('retry_backoff', 60)))
+    delay = delays.Delay(d.get('delay', cfg['action_delay'])).mean()
+    attempts = sum(probFail**k for k in range(retries + 1))
+    waits = sum(probFail**(k+1) * backoff * 2**k for k in range(retries))
+    busy = delay * attempts + waits
+    interval = cronInterval(d.get('cron', '* *'))
+    return interval * max(1, math.ceil(busy / interval)), probFail**(retries+1)
+
+
+def solveNetwork(G, cfg, tol=1e-9):
+    '''Estimate rates and queue statistics of graph G (as loaded by
+literate.loadDataflow) under configuration CFG.
+Returns dict of arrays indexed like G.graph['plan']['nodes']:
+  rate:: offered messages per second arriving at the node
+  service:: seconds per message (actions; NaN elsewhere)
+  util:: utilization (queues and actions; NaN elsewhere)
+  depth:: expected depth (queues; inf if unstable)
+and converged (False if the rates grow around a loop).
+TOL:: loops passing on more than 1-TOL of what they take in never drain'''
+    plan = G.graph['plan']
+    nodes = plan['nodes']
+    types = plan['types']
+    n = len(nodes)
+    gamma = np.zeros(n)
+    service = np.full(n, np.nan)
+    giveUp = np.zeros(n)
+    for i, name in enumerate(nodes):
+        d = G.node[name]
+        if types[i] == 's':
+            gamma[i] = sourceRate(d, cfg)
+        elif types[i] == 'a':
+            service[i], giveUp[i] = serviceTime(d, cfg)
+
+    # Routing fraction of every edge
+    src = np.array([u for (u, v, etype) in plan['edges']], dtype=int)
+    dst = np.array([v for (u, v, etype) in plan['edges']], dtype=int)
+    weight = np.ones(len(src))
+    for j, (u, v, etype) in enumerate(plan['edges']):
+        if types[u] == 'q':
+            weight[j] /= len(plan['outEdges'][u])
+        elif types[u] == 'a':
+            onFail = G.node[nodes[u]].get('on_fail')
+            if nodes[v] == onFail:
+                weight[j] = giveUp[u]
+            else:
+                weight[j] = 1 - giveUp[u]
+        if types[v] == 'a' and G.node[nodes[v]].get('join') == 'all':
+            weight[j] /= len(plan['inEdges'][v])
+
+    rate = solveTraffic(n, src, dst, weight, gamma, tol)
+    converged = bool(np.all(np.isfinite(rate)))
+    if not converged:
+        logging.warning('Analytic rates are unbounded: data loops forever'
+                        ' (%d nodes on or after the loop)',
+                        np.count_nonzero(np.isinf(rate)))
+
+    # Utilization: a queue is served by all its readers, an action by
+    # its busiest input (it takes one message of each per cycle)
+    util = np.full(n, np.nan)
+    for i in range(n):
+        if types[i] == 'a':
+            readFrom = [rate[src[j]] * weight[j] for j in plan['inEdges'][i]]
+            util[i] = max(readFrom, default=0.0) * service[i]
+        elif types[i] == 'q' and plan['outEdges'][i]:
+            capacity = sum(1.0 / service[dst[j]] for j in plan['outEdges'][i])
+            util[i] = rate[i] / capacity
+    depth = np.full(n, np.nan)
+    isQueue = np.array([t == 'q' for t in types]) & ~np.isnan(util)
+    stable = isQueue & (util < 1)
+    depth[stable] = util[stable] / (1 - util[stable])
+    depth[isQueue & ~stable] = np.inf
+    return dict(nodes=nodes, types=types, rate=rate, service=service,
+                util=util, depth=depth, converged=converged)
+
+
+def solveTraffic(n, src, dst, weight, gamma, tol=1e-9):
+    '''Solve lam = GAMMA + P^T lam for the N nodes, where edge j (SRC[j]
+to DST[j]) carries fraction WEIGHT[j] of what its source gets.  Nodes on
+or after a loop that never drains, if data reaches it, get inf.'''
+    flow = np.zeros((n, n)) # flow[v, u] = P[u, v]
+    np.add.at(flow, (dst, src), weight)
+    F = nx.DiGraph()
+    F.add_nodes_from(range(n))
+    F.add_edges_from((int(u), int(v))
+                     for (u, v, w) in zip(src, dst, weight) if w > 0)
+    fed = set()
+    for i in np.flatnonzero(gamma > 0):
+        fed.add(int(i))
+        fed.update(nx.descendants(F, int(i)))
+
+    # Loops that pass on as much as they take in (spectral radius >= 1)
+    endless = set()
+    idle = set() # endless loops no data reaches: their rate is 0
+    for comp in nx.strongly_connected_components(F):
+        comp = sorted(comp)
+        if len(comp) == 1 and not F.has_edge(comp[0], comp[0]):
+            continue
+        gain = max(abs(np.linalg.eigvals(flow[np.ix_(comp, comp)])))
+        if gain >= 1 - tol:
+            if fed.isdisjoint(comp):
+                idle.update(comp)
+            else:
+                endless.update(comp)
+    infinite = set(endless)
+    for i in endless:
+        infinite.update(nx.descendants(F, i))
+
+    rate = np.zeros(n)
+    rate[sorted(infinite)] = np.inf
+    solve = [i for i in range(n) if i not in infinite and i not in idle]
+    if solve:
+        rate[solve] = np.linalg.solve(
+            np.eye(len(solve)) - flow[np.ix_(solve, solve)], gamma[solve])
+    return rate
+
+
+def unstable(result):
+    'Names of queues and actions with utilization >= 1.'
+    util = result['util']
+    return [result['nodes'][i] for i in range(len(util)) if util[i] >= 1]
+
+
+def printReport(result, file=None):
+    hours = 60*60
+    print('#'*55, file=file)
+    print('Analytic estimate (offered rates, M/M/1 depths):', file=file)
+    print('  %25s %4s %10s %10s %8s %10s'
+          % ('Node', 'Type', 'Rate/hr', 'Service', 'Util', 'Depth'),
+          file=file)
+    for i, n in enumerate(result['nodes']):
+        ntype = result['types'][i]
+        if ntype not in ('q', 't', 'a'):
+            continue
+        util = result['util'][i]
+        print('  %25s %4s %10.2f %10s %8s %10s %s'
+              % (n, ntype, result['rate'][i] * hours,
+                 '' if np.isnan(result['service'][i])
+                 else '%.0f' % result['service'][i],
+                 '' if np.isnan(util) else '%.3f' % util,
+                 '' if np.isnan(result['depth'][i])
+                 else '%.2f' % result['depth'][i],
+                 'UNSTABLE' if util >= 1 else ''),
+              file=file)
+    bad = unstable(result)
+    if bad:
+        print('WARNING: %d unstable nodes: %s' % (len(bad), ', '.join(bad)),
+              file=file)
+
+
+def resultRow(params, G, result):
+    'Flatten one estimate into a row like sweep.resultRow().'
+    plan = G.graph['plan']
+    util = result['util']
+    row = dict(params)
+    row['throughput'] = sum(result['rate'][i] for i in plan['sinks'])
+    row['max_util'] = float(np.nanmax(util)) if not np.isnan(util).all() else 0
+    row['unstable'] = len(unstable(result))
+    return row
+
+
+def writeTable(rows, outfile, paramNames):
+    fields = list(paramNames) + ['throughput', 'max_util', 'unstable']
+    writer = csv.DictWriter(outfile, fieldnames=fields)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
@@ -0,0 +1,253 @@
+'''\
+Checkpoint (snapshot) and resume of a simulation.
+
+SimPy processes are generators, which can not be saved.  A checkpoint
+therefore holds the *data* of the simulation at time T: queue contents
+(including puts waiting for room), work in hand of every action,
+progress of every source, counters, and random number generator
+states.  To resume, the network is set up again from the dot file in an
+environment starting at T, and the data is restored into it before it
+runs.  The result is close to, but not exactly, an uninterrupted run:
+  - An action that was running at T runs that message again from the
+    start (its CPU time is spent again, a retry backoff is skipped).
+    Idle actions keep the cron tick they were waiting for (or take the
+    next input at once, if the tick had passed).
+  - Messages on a network link at T are transferred again from the start
+    (received messages go back to the head of their queue).
+  - Metrics, graphite and event log outputs only cover the resumed part.
+The configuration and dot file may be changed for the resumed run ("what
+if" runs from a common warm-up); state of nodes that no longer exist is
+ignored.
+'''
+
+import logging
+import pickle
+import random
+
+import simpy
+
+from daflsim import daflsim
+from daflsim import messages
+
+# Bump when the layout of the snapshot changes
+snapshotVersion = 5
+
+
+def queueState(q):
+    return dict(items=q.items.timed(),
+                waiting=[event.item for event in q.put_queue],
+                stats=q.stats,
+                drops=q.drops)
+
+def blockedOn(sim, pipeKeys):
+    '''Puts SIM is blocked on: [(key of queue or pipe, msg), ...].'''
+    if sim.blockedOn is None:
+        return []
+    return [(pipeKeys[id(event.resource)], event.item)
+            for event in sim.blockedOn if not event.triggered]
+
+def restoreQueue(q, state):
+    now = q.env.now
+    # Not profiled before the checkpoint: count (waits too) from now on
+    fresh = (q.stats is not None) and (state['stats'] is None)
+    q.items.clear()
+    for item, putTime in state['items']:
+        q.items.append(item, now if fresh else putTime)
+    q.drops = state['drops']
+    if q.stats is not None:
+        if fresh:
+            q.stats.lastDepth = len(q.items)
+        else:
+            q.stats = state['stats']
+    events = [(item, q.put(item)) for item in state['waiting']]
+    for observe in q.observers:
+        observe(q)
+    return events
+
+def requeue(q, msg):
+    'Put MSG back at the head of queue Q (it was taken, but not used).'
+    q.items.appendleft(msg, q.env.now)
+    if q.stats is not None:
+        q.stats.depth(q.env.now, len(q.items))
+
+
+def save(env, G, outfile, cfg=None, seed=None):
+    '''Write snapshot of simulation (ENV, G) to binary OUTFILE. CFG and SEED
+are saved so the resumed run can default to them.'''
+    plan = G.graph['plan']
+    nodes = plan['nodes']
+    snap = dict(version=snapshotVersion, time=env.now, cfg=cfg, seed=seed,
+                random=random.getstate(),
+                queues=dict(), pipes=dict(), sources=dict(), actions=dict(),
+                cpus=dict(), links=dict())
+
+    pipeKeys = dict()
+    for (ui, vi, etype) in plan['edges']:
+        if etype in ('sa', 'aa'):
+            pipe = G[nodes[ui]][nodes[vi]]['pipe']
+            pipeKeys[id(pipe)] = ('pipe', (nodes[ui], nodes[vi]))
+    for i,n in enumerate(nodes):
+        if plan['types'][i] in ('q', 't'):
+            pipeKeys[id(G.node[n]['sim'])] = ('queue', n)
+
+    for i,n in enumerate(nodes):
+        ntype = plan['types'][i]
+        sim = G.node[n].get('sim')
+        if ntype in ('q', 't'):
+            snap['queues'][n] = queueState(sim)
+        elif ntype == 's':
+            snap['sources'][n] = dict(outCount=sim.outCount,
+                                      blocked=daflsim.blockedTime(
+                                          sim, env.now),
+                                      nextAt=sim.nextAt,
+                                      traceStart=getattr(sim, 'traceStart',
+                                                         None),
+                                      blockedOn=blockedOn(sim, pipeKeys),
+                                      delay=sim.delay.getState())
+        elif ntype == 'a':
+            waiting = [] if sim.held is None else [sim.held]
+            held = [event.value for event in sim.pending.values()
+                    if event.triggered]
+            if held:
+                waiting.append(messages.join(held))
+            table = sim.joinTable
+            snap['actions'][n] = dict(
+                current=sim.current,
+                waiting=waiting,
+                tickAt=sim.tickAt,
+                blockedOn=blockedOn(sim, pipeKeys),
+                blocked=daflsim.blockedTime(sim, env.now),
+                failures=sim.failures,
+                retried=sim.retried,
+                gaveUp=sim.gaveUp,
+                wasted=sim.wasted,
+                delay=sim.delay.getState(),
+                join=None if table is None else dict(
+                    width=table.width, pending=table.pending,
+                    matched=table.matched, ready=list(sim.ready.items)))
+
+    for (ui, vi, etype) in plan['edges']:
+        u = nodes[ui]
+        v = nodes[vi]
+        d = G[u][v]
+        if etype in ('sa', 'aa'):
+            snap['pipes'][(u,v)] = queueState(d['pipe'])
+        if 'link' in d:
+            link = d['link']
+            snap['links'][(u,v)] = dict(sent=link.sent, bytes=link.bytes,
+                                        busy=link.busy,
+                                        waitTotal=link.waitTotal,
+                                        inFlight=list(link.inFlight))
+
+    for host, cpu in G.graph['cpus'].items():
+        snap['cpus'][host] = dict(busy=cpu.busy, runs=cpu.runs,
+                                  waitTotal=cpu.waitTotal,
+                                  waitMax=cpu.waitMax)
+
+    if 'latency' in G.graph:
+        tracker = G.graph['latency']
+        snap['latency'] = dict(stages=dict(tracker.stages),
+                               endToEnd=tracker.endToEnd)
+
+    pickle.dump(snap, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+    logging.info('Saved checkpoint at time %s', env.now)
+
+
+def load(infile):
+    snap = pickle.load(infile)
+    if snap.get('version') != snapshotVersion:
+        raise ValueError('Unsupported checkpoint version %s (expecting %s)'
+                         % (snap.get('version'), snapshotVersion))
+    return snap
+
+
+def restore(env, G, snap):
+    '''Put state of SNAP into simulation (ENV, G), which must be freshly
+set up (not yet run) in an environment starting at the snapshot time.'''
+    if env.now != snap['time']:
+        raise ValueError('Environment starts at %s, checkpoint is at %s'
+                         % (env.now, snap['time']))
+    random.setstate(snap['random'])
+    missing = 0
+
+    # Puts waiting for room, by queue or pipe: [(msg, put event), ...]
+    puts = dict()
+    for n, state in snap['queues'].items():
+        if n in G and 'sim' in G.node[n]:
+            puts[('queue', n)] = restoreQueue(G.node[n]['sim'], state)
+        else:
+            missing += 1
+
+    for (u,v), state in snap['pipes'].items():
+        if G.has_edge(u, v) and 'pipe' in G[u][v]:
+            puts[('pipe', (u,v))] = restoreQueue(G[u][v]['pipe'], state)
+        else:
+            missing += 1
+
+    def putEvents(blocked):
+        'Restored put events of BLOCKED [(key, msg), ...].'
+        return [event for (key, msg) in blocked
+                for (item, event) in puts.get(key, [])
+                if item is msg]
+
+    for n, state in snap['sources'].items():
+        if n not in G or 'sim' not in G.node[n]:
+            missing += 1
+            continue
+        sim = G.node[n]['sim']
+        sim.outCount = state['outCount']
+        sim.blocked = state['blocked']
+        sim.delay.setState(state['delay'])
+        sim.resume = dict(nextAt=state['nextAt'],
+                          traceStart=state['traceStart'],
+                          blockedOn=putEvents(state['blockedOn']))
+
+    for n, state in snap['actions'].items():
+        if n not in G or 'sim' not in G.node[n]:
+            missing += 1
+            continue
+        sim = G.node[n]['sim']
+        for attr in ('blocked', 'failures', 'retried', 'gaveUp', 'wasted'):
+            setattr(sim, attr, state[attr])
+        sim.delay.setState(state['delay'])
+        if state['join'] is not None:
+            sim.joinTable = messages.JoinTable(state['join']['width'])
+            sim.joinTable.pending = state['join']['pending']
+            sim.joinTable.matched = state['join']['matched']
+            # Complete sets; their parts from queue inputs are still
+            # queued (the same objects, restored above)
+            sim.ready = simpy.Store(env)
+            sim.ready.items.extend(state['join']['ready'])
+        sim.resume = dict(current=state['current'],
+                          waiting=state['waiting'],
+                          tickAt=state['tickAt'],
+                          blockedOn=putEvents(state['blockedOn']))
+
+    for (u,v), state in snap['links'].items():
+        if not (G.has_edge(u, v) and 'link' in G[u][v]):
+            missing += 1
+            continue
+        d = G[u][v]
+        link = d['link']
+        for attr in ('sent', 'bytes', 'busy', 'waitTotal'):
+            setattr(link, attr, state[attr])
+        for msg, direction in state['inFlight']:
+            if direction == 'send':
+                env.process(link.send(msg, d['pipe']))
+            else:
+                requeue(d['pipe'], msg)
+
+    for host, state in snap['cpus'].items():
+        if host in G.graph['cpus']:
+            cpu = G.graph['cpus'][host]
+            for attr, value in state.items():
+                setattr(cpu, attr, value)
+
+    if ('latency' in snap) and ('latency' in G.graph):
+        tracker = G.graph['latency']
+        tracker.stages.update(snap['latency']['stages'])
+        tracker.endToEnd = snap['latency']['endToEnd']
+
+    if missing > 0:
+        logging.warning('Checkpoint state of %d nodes/edges not in this'
+                        ' graph was ignored', missing)
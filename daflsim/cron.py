@@ -1,3 +1,7 @@
+import argparse
+
+import numpy as np
+
 # Calculate stuff from CRON string
 
 # Minutes since start of hour
@@ -54,3 +58,79 @@ def next_time(nowSeconds, cronstr, factor=60):
         return delayMinutes*60
     else:
         return delayMinutes*60 + delayHours*60*60
+
+
+class CronSchedule():
+    '''\
+A cron spec compiled into a table of delays, one per minute of its
+period (an hour, or a day when HOUR is given).  Answers exactly what
+next_time() would, without re-parsing the spec.
+    '''
+    def __init__(self, cronstr):
+        self.cronstr = cronstr
+        parts = cronstr.split()
+        hourly = (len(parts) < 2) or (parts[1] == '*')
+        self.period = 60 if hourly else 60*24 # minutes
+        self.table = [next_time(m*60, cronstr) for m in range(self.period)]
+        self._array = None
+
+    def next_time(self, nowSeconds):
+        'Seconds from NOWSECONDS until the job fires.'
+        return self.table[int(nowSeconds/60) % self.period]
+
+    def next_times(self, nowSeconds):
+        'Vectorized next_time() over an array of times.'
+        if self._array is None:
+            self._array = np.array(self.table)
+        minutes = (np.asarray(nowSeconds) // 60).astype(int)
+        return self._array[minutes % self.period]
+
+compiled = dict() # compiled[cronstr] = CronSchedule
+
+def schedule(cronstr):
+    'Return the (shared) compiled schedule for CRONSTR.'
+    if cronstr not in compiled:
+        compiled[cronstr] = CronSchedule(cronstr)
+    return compiled[cronstr]
+
+
+def checkSchedule(cronstr, step=7):
+    '''Compare the compiled schedule of CRONSTR (one at a time and
+vectorized) to next_time(), every STEP seconds over two of its periods.
+Returns the number of mismatches.'''
+    sched = CronSchedule(cronstr)
+    times = np.arange(0, 2*sched.period*60, step)
+    vectorized = sched.next_times(times)
+    bad = 0
+    for t, vec in zip(times, vectorized):
+        expected = next_time(t, cronstr)
+        if (sched.next_time(t) != expected) or (vec != expected):
+            bad += 1
+    return bad
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Show when cron specs fire, checking the compiled'
+        ' schedules against next_time()',
+        epilog='EXAMPLE: %(prog)s "*/2 *" "35 */3"'
+        )
+    parser.add_argument('specs', nargs='+',
+                        help='Cron spec: "minute hour" or "minute"')
+    parser.add_argument('--count', type=int, default=5,
+                        help='Number of firings to show [default=%(default)s]')
+    args = parser.parse_args()
+
+    for spec in args.specs:
+        sched = schedule(spec)
+        now = 0
+        fires = []
+        for i in range(args.count):
+            now += sched.next_time(now)
+            fires.append(now)
+        mismatches = checkSchedule(spec)
+        print('%-10s period=%4d minutes; fires at %s; mismatches=%d'
+              % (spec, sched.period, ', '.join(str(t) for t in fires),
+                 mismatches))
+
+if __name__ == '__main__':
+    main()
@@ -28,7 +28,7 @@ import sys
 import argparse
 import logging
 import random
-from collections import defaultdict
+from collections import defaultdict, deque, OrderedDict
 import functools
 import json
 
@@ -38,6 +38,17 @@ from daflsim import actions
 from daflsim import literate
 from daflsim import defaultCfg
 from daflsim import cron
+from daflsim import replicate
+from daflsim import sweep
+from daflsim import metrics
+from daflsim import messages
+from daflsim import delays
+from daflsim import traces
+from daflsim import eventlog
+from daflsim import checkpoint
+from daflsim import steady
+from daflsim import analytic
+from daflsim import analysis
 
 import networkx as nx
 
@@ -67,36 +78,122 @@ def print_summary(env, G, summarizeNodes=None):
         qmap = dict()  # qmap[name] = Dataq
         for (n, d) in G.nodes_iter(data=True):
             if ('sim' in d) and isinstance(d['sim'], Dataq):
-                instance = d['sim']
-                if not hasattr(instance, 'putcount'):
-                    setattr(instance, 'putcount', 0)
-                if not hasattr(instance, 'hiwater'):
-                    setattr(instance, 'hiwater', 0)
-
                 qmap[d['sim'].name] = d['sim']
 
         print('Dataq use summary:')
         print('  %15s  %5s %5s %s' % ('Queue', 'Put',   'Max',  ''))
         print('  %15s  %5s %5s %s' % ('Name' , 'Count', 'Used', 'Comment'))
         for name in sorted(qmap.keys()):
+            stats = qmap[name].stats
             print('  %15s: %5d %5d %s'
                   % (name,
-                     qmap[name].putcount,
-                     qmap[name].hiwater,
-                     'WARNING: unused' if qmap[name].hiwater == 0 else ''
+                     stats.puts,
+                     stats.hiwater,
+                     'WARNING: unused' if stats.hiwater == 0 else ''
                  ))
         print()
 
-        siList = simpy.Store.instances
-        siList.sort(key=lambda x: x.edge)
+        print('Dataq timing summary:')
+        print('  %15s  %5s %8s %8s %8s'
+              % ('Queue', 'Get', 'Mean', 'Mean', 'Max'))
+        print('  %15s  %5s %8s %8s %8s'
+              % ('Name', 'Count', 'Depth', 'Wait', 'Wait'))
+        for name in sorted(qmap.keys()):
+            stats = qmap[name].stats
+            print('  %15s: %5d %8.2f %8.1f %8.1f'
+                  % (name,
+                     stats.gets,
+                     stats.meanDepth(env.now),
+                     stats.meanWait(),
+                     stats.waitMax))
+        print()
+
+        siList = sorted([d['pipe'] for u,v,d in G.edges_iter(data=True)
+                         if isinstance(d.get('pipe'), Pipe)],
+                        key=lambda x: x.edge)
         if len(siList) > 0:
             print('Store use summary (%d):'%len(siList))
             for si in siList:
                 print('\t Edge %s: putcount=%d'
                       %(si.edge,
-                        getattr(si, 'putcount',-1)
+                        si.stats.puts
                     ))
 
+        print()
+        print('Host CPU summary:')
+        print('  %15s %5s %6s %9s %6s %8s %8s'
+              % ('Host', 'Cores', 'Runs', 'Busy', 'Util', 'MeanWait',
+                 'MaxWait'))
+        cpus = G.graph['cpus']
+        for host in sorted(cpus.keys()):
+            cpu = cpus[host]
+            util = cpu.utilization(env.now)
+            print('  %15s %5s %6d %9.1f %6s %8.1f %8.1f'
+                  % (host,
+                     '-' if cpu.cores == None else cpu.cores,
+                     cpu.runs,
+                     cpu.busy,
+                     '-' if util == None else '%5.1f%%' % (100*util),
+                     cpu.meanWait(),
+                     cpu.waitMax))
+
+        blocked = [(n, blockedTime(d['sim'], env.now))
+                   for n,d in G.nodes_iter(data=True)
+                   if hasattr(d.get('sim'), 'blocked')]
+        blocked = [(n, t) for (n, t) in blocked if t > 0]
+        dropped = [q for q in qmap.values() if q.drops > 0]
+        if len(blocked) + len(dropped) > 0:
+            print()
+            print('Backpressure summary:')
+            for n,t in sorted(blocked, key=lambda x: x[0]):
+                print('  %15s: blocked %.1f seconds on full queues'
+                      % (n, t))
+            for q in sorted(dropped, key=lambda x: x.name):
+                print('  %15s: dropped %d items (capacity=%s, policy=%s)'
+                      % (q.name, q.drops, q.capacity, q.policy))
+
+        failing = [(n, d['sim']) for n,d in G.nodes_iter(data=True)
+                   if getattr(d.get('sim'), 'failures', 0) > 0]
+        if len(failing) > 0:
+            print()
+            print('Failure summary:')
+            print('  %15s %8s %8s %8s %9s %s'
+                  % ('Action', 'Failures', 'Retried', 'GaveUp', 'Wasted',
+                     'Failed to'))
+            for n,sim in sorted(failing, key=lambda x: x[0]):
+                print('  %15s %8d %8d %8d %9.1f %s'
+                      % (n, sim.failures, sim.retried, sim.gaveUp,
+                         sim.wasted, sim.onFail or '<<dropped>>'))
+
+        joins = [(n, d['sim'].joinTable) for n,d in G.nodes_iter(data=True)
+                 if getattr(d.get('sim'), 'joinTable', None) is not None]
+        if len(joins) > 0:
+            print()
+            print('Join (all-of) summary:')
+            print('  %15s %7s %7s %7s' % ('Node', 'Inputs', 'Matched',
+                                          'Waiting'))
+            for n,table in sorted(joins, key=lambda x: x[0]):
+                print('  %15s %7d %7d %7d'
+                      % (n, table.width, table.matched, table.waiting()))
+
+        links = sorted(G.graph['links'], key=lambda x: x.edge)
+        if len(links) > 0:
+            print()
+            print('Network link summary:')
+            print('  %25s %10s %6s %6s %10s %6s %8s'
+                  % ('Edge', 'Bandwidth', 'Lat', 'Sent', 'MBytes', 'Util',
+                     'MeanWait'))
+            for link in links:
+                print('  %25s %10s %6.2f %6d %10.1f %5.1f%% %8.1f'
+                      % ('%s->%s' % link.edge,
+                         '-' if link.bandwidth == None
+                         else '%.3g' % link.bandwidth,
+                         link.latency,
+                         link.sent,
+                         link.bytes / 1e6,
+                         100*link.utilization(env.now),
+                         link.meanWait()))
+
     for nid in summarizeNodes:
         inst = G.node[nid]['sim']
         #!print('%d of %s get slots are allocated.'
@@ -111,15 +208,19 @@ def print_summary(env, G, summarizeNodes=None):
             #!print('  Queued %d total items:\n\t%s'
             #!      % (len(inst.items),
             #!         '\n\t'.join(sorted(inst.items))))
-            print('  Contains %d unique items:'
-                  % (len(set(inst.items))))
-            print('\t%s'%(', '.join(sorted(set(inst.items)))))
+            unique = sorted(set(str(m) for m in inst.items))
+            print('  Contains %d unique items:' % (len(unique),))
+            print('\t%s'%(', '.join(unique)))
         elif G.node[nid]['type'] == 's':
             print('  Name=%s, host=%s, outCount=%s'
                   % (inst.name, inst.host, inst.outCount))
         else:
             print('  <<no summary for nodes of type="%s"'%G.node[nid]['type'])
 
+    if 'latency' in G.graph:
+        print()
+        G.graph['latency'].report()
+
 
 # Example plaintext feed to Graphite:
 #   <metric path> <metric value> <metric timestamp>.
@@ -144,23 +245,387 @@ class Monitor():
         if self.file:
             self.file.close()
 
+def graphiteObserver(dataq):
+    feed_graphite('dataq.%s'%dataq.name, len(dataq.items), dataq.env.now)
+
+class QueueStats():
+    '''Counters of one Dataq. Only kept when profiling.'''
+    __slots__ = ('puts', 'gets', 'hiwater', 'area', 'lastTime', 'lastDepth',
+                 'waitTotal', 'waitMax')
+
+    def __init__(self, now):
+        self.puts = 0
+        self.gets = 0
+        self.hiwater = 0
+        self.area = 0.0 # integral of depth over time
+        self.lastTime = now
+        self.lastDepth = 0
+        self.waitTotal = 0.0
+        self.waitMax = 0.0
+
+    def depth(self, now, depth):
+        self.area += self.lastDepth * (now - self.lastTime)
+        self.lastTime = now
+        self.lastDepth = depth
+
+    def put(self, now, depth):
+        self.puts += 1
+        self.depth(now, depth)
+        if depth > self.hiwater:
+            self.hiwater = depth
+
+    def drop(self, now, depth):
+        'An item was discarded to make room.'
+        self.depth(now, depth)
+
+    def get(self, now, depth, putTime):
+        'An item queued at PUTTIME was taken.'
+        self.gets += 1
+        self.depth(now, depth)
+        wait = now - putTime
+        self.waitTotal += wait
+        if wait > self.waitMax:
+            self.waitMax = wait
+
+    def meanDepth(self, now):
+        'Time weighted mean depth from creation until NOW.'
+        area = self.area + self.lastDepth * (now - self.lastTime)
+        return area / now if now > 0 else 0.0
+
+    def meanWait(self):
+        return self.waitTotal / self.gets if self.gets > 0 else 0.0
+
+class QueueItems():
+    '''The items of a Dataq in FIFO order, each with the time it was put.
+Items are also indexed by identity, so one can be found or removed from
+the middle of the queue (see Dataq.take) in O(1).  The same item may be
+queued more than once.'''
+    __slots__ = ('entries', 'where', 'first', 'last')
+
+    def __init__(self):
+        self.entries = OrderedDict() # entries[seq] = (item, put time)
+        self.where = dict() # where[id(item)] = deque of seqs, oldest first
+        self.first = 0 # seq before the oldest entry
+        self.last = 0  # seq of the newest entry
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return (item for (item, putTime) in self.entries.values())
+
+    def __contains__(self, item):
+        return id(item) in self.where
+
+    def __getitem__(self, index):
+        'Only the oldest (0) and the newest (-1) items.'
+        if index == 0:
+            return next(iter(self.entries.values()))[0]
+        if index == -1:
+            return next(reversed(self.entries.values()))[0]
+        raise IndexError('Queue items can only be indexed by 0 or -1')
+
+    def append(self, item, putTime):
+        self.last += 1
+        self.entries[self.last] = (item, putTime)
+        seqs = self.where.get(id(item))
+        if seqs is None:
+            self.where[id(item)] = deque([self.last])
+        else:
+            seqs.append(self.last)
+
+    def appendleft(self, item, putTime):
+        seq = self.first
+        self.first -= 1
+        self.entries[seq] = (item, putTime)
+        self.entries.move_to_end(seq, last=False)
+        self.where.setdefault(id(item), deque()).appendleft(seq)
+
+    def popleft(self):
+        'Remove the oldest entry. Returns (item, put time).'
+        seq, entry = self.entries.popitem(last=False)
+        self.forget(entry[0])
+        return entry
+
+    def remove(self, item):
+        'Remove (the oldest entry of) ITEM. Returns its put time.'
+        seqs = self.where.get(id(item))
+        if seqs is None:
+            raise ValueError('Item is not queued')
+        item, putTime = self.entries.pop(seqs[0])
+        self.forget(item)
+        return putTime
+
+    def forget(self, item):
+        seqs = self.where[id(item)]
+        seqs.popleft()
+        if not seqs:
+            del self.where[id(item)]
+
+    def clear(self):
+        self.entries.clear()
+        self.where.clear()
+
+    def timed(self):
+        'List of (item, put time), oldest first.'
+        return list(self.entries.values())
+
+# What a full Dataq does with one more item
+queuePolicies = ('block', 'drop-new', 'drop-old')
+
 class Dataq(simpy.Store):
-    '''Data Queue.'''
-    instances = list()
-    def __init__(self, env, name,  capacity=float('inf')):
-        logging.debug('Creating dataq: %s'%name)
+    '''Data Queue.
+
+When the queue holds CAPACITY items, POLICY decides what happens to the
+next one: 'block' makes the producer wait for room, 'drop-new' discards
+it, 'drop-old' discards the oldest queued item instead.  Discarded
+items are counted in DROPS.
+
+ITEMS is a QueueItems (not a list).  If PROFILE, counters are kept in
+STATS (else STATS is None).  Functions in OBSERVERS are called with the
+queue whenever its depth changes (an item was put or taken).  WATCHER (a
+JoinInput, or None) is told of every item put, and of every item removed
+other than by take().'''
+    def __init__(self, env, name,  capacity=float('inf'), profile=False,
+                 policy='block'):
+        logging.debug('Creating dataq: %s', name)
+        if policy not in queuePolicies:
+            raise ValueError('Queue %s: invalid policy "%s". Expecting one of: %s'
+                             % (name, policy, ', '.join(queuePolicies)))
         self.env = env
         self.name = name
         self.simType = 'q'
+        self.policy = policy
+        # Producers wait for puts that can not complete right away
+        self.blocking = (policy == 'block')
+        self.drops = 0
+        self.stats = QueueStats(env.now) if profile else None
+        self.observers = []
+        self.watcher = None
         super().__init__(env,capacity=capacity)
-        Dataq.instances.append(self)
-
-
+        self.items = QueueItems()
+
+    def put(self, item):
+        if (self.policy != 'block') and (len(self.items) >= self.capacity):
+            self.drops += 1
+            if self.policy == 'drop-new':
+                return self.env.event().succeed()
+            dropped, putTime = self.items.popleft()
+            if self.stats is not None:
+                self.stats.drop(self.env.now, len(self.items))
+            if self.watcher is not None:
+                self.watcher.removed(dropped)
+        return super().put(item)
+
+    def take(self, item):
+        '''Remove queued ITEM (which need not be the oldest) as if by a get,
+making room for waiting puts.'''
+        putTime = self.items.remove(item)
+        if self.stats is not None:
+            self.stats.get(self.env.now, len(self.items), putTime)
+        for observe in self.observers:
+            observe(self)
+        self._trigger_put(None)
+
+    # Like simpy.Store's, but keeping put times in ITEMS
+    def _do_put(self, event):
+        if len(self.items) < self._capacity:
+            self.items.append(event.item, self.env.now)
+            event.succeed()
+            if self.stats is not None:
+                self.stats.put(self.env.now, len(self.items))
+            for observe in self.observers:
+                observe(self)
+            if self.watcher is not None:
+                self.watcher.arrived(event.item)
+
+    def _do_get(self, event):
+        if self.items:
+            item, putTime = self.items.popleft()
+            event.succeed(item)
+            if self.stats is not None:
+                self.stats.get(self.env.now, len(self.items), putTime)
+            for observe in self.observers:
+                observe(self)
+            if self.watcher is not None:
+                self.watcher.removed(item)
+
+class Pipe(Dataq):
+    '''Hand-off (one item at a time) along graph EDGE (u,v).'''
+    def __init__(self, env, edge, profile=False):
+        super().__init__(env, '%s->%s' % edge, capacity=1, profile=profile)
+        self.simType = 'p'
+        self.edge = edge
+        self.blocking = False # pending puts wait here, not the producer
+
+
+
+class HostCpu(simpy.Resource):
+    '''The CPU cores of one HOST. Actions on the host hold a core while
+they run. CORES=None means unlimited (no contention).'''
+    def __init__(self, env, host, cores=None):
+        self.env = env
+        self.host = host
+        self.cores = cores
+        super().__init__(env, capacity=float('inf') if cores == None else cores)
+        self.busy = 0.0 # core-seconds used
+        self.runs = 0
+        self.waitTotal = 0.0
+        self.waitMax = 0.0
+
+    def use(self, duration):
+        'Process: wait for a core, then hold it for DURATION seconds.'
+        requested = self.env.now
+        with self.request() as req:
+            yield req
+            wait = self.env.now - requested
+            self.waitTotal += wait
+            if wait > self.waitMax:
+                self.waitMax = wait
+            yield self.env.timeout(duration)
+        self.busy += duration
+        self.runs += 1
+
+    def utilization(self, now):
+        'Fraction of core time used, or None if cores are unlimited.'
+        if self.cores == None or now <= 0:
+            return None
+        return self.busy / (self.cores * now)
+
+    def meanWait(self):
+        return self.waitTotal / self.runs if self.runs > 0 else 0.0
+
+def hostCores(host):
+    'Number of cores of HOST from configuration (None for unlimited).'
+    cores = cfg.get('host_cores', {}).get(host, cfg.get('default_cores'))
+    return None if cores == None else int(cores)
+
+class Link():
+    '''Network link carrying graph EDGE (u,v) between two hosts.  One
+message is on the wire at a time (FIFO) for SIZE/BANDWIDTH seconds, then
+takes LATENCY seconds to arrive. BANDWIDTH=None means unlimited.'''
+    def __init__(self, env, edge, bandwidth=None, latency=0):
+        self.env = env
+        self.edge = edge
+        self.bandwidth = bandwidth
+        self.latency = latency
+        self.wire = simpy.Resource(env, capacity=1)
+        self.sent = 0
+        self.bytes = 0
+        self.busy = 0.0 # seconds the wire was in use
+        self.waitTotal = 0.0
+        self.inFlight = [] # (msg, 'send' or 'receive') being transferred
+
+    def transfer(self, msg):
+        'Process: move MSG across the link.'
+        if self.bandwidth:
+            requested = self.env.now
+            with self.wire.request() as req:
+                yield req
+                self.waitTotal += self.env.now - requested
+                duration = msg.size / self.bandwidth
+                yield self.env.timeout(duration)
+            self.busy += duration
+        if self.latency:
+            yield self.env.timeout(self.latency)
+        self.sent += 1
+        self.bytes += msg.size
+        return msg
+
+    def send(self, msg, pipe):
+        'Process: move MSG across the link, then put it on PIPE.'
+        entry = (msg, 'send')
+        self.inFlight.append(entry)
+        yield from self.transfer(msg)
+        self.inFlight.remove(entry)
+        yield pipe.put(msg)
+
+    def utilization(self, now):
+        return self.busy / now if now > 0 else 0.0
+
+    def meanWait(self):
+        return self.waitTotal / self.sent if self.sent > 0 else 0.0
+
+class LinkSender():
+    '''Output end of a link: looks like PIPE to the sending node, but
+each put travels over LINK first.'''
+    blocking = False # the sender does not wait for the transfer
+
+    def __init__(self, link, pipe):
+        self.link = link
+        self.pipe = pipe
+
+    def put(self, msg):
+        return self.link.env.process(self.link.send(msg, self.pipe))
+
+class LinkReceiver():
+    '''Input end of a link: looks like PIPE to the receiving node, but
+each item taken travels over LINK before the get completes.'''
+    def __init__(self, link, pipe):
+        self.link = link
+        self.pipe = pipe
+
+    def get(self):
+        return self.link.env.process(self.receive())
+
+    def receive(self):
+        msg = yield self.pipe.get()
+        entry = (msg, 'receive')
+        self.link.inFlight.append(entry)
+        yield from self.link.transfer(msg)
+        self.link.inFlight.remove(entry)
+        return msg
+
+def putAll(env, puts, producer):
+    '''Process: put each MSG of PUTS [(pipe, msg), ...]. Waits while
+blocking pipes are full (backpressure), see waitPuts().'''
+    waits = []
+    for pipe, msg in puts:
+        event = pipe.put(msg)
+        if pipe.blocking and not event.triggered:
+            waits.append(event)
+    yield from waitPuts(env, waits, producer)
+
+def waitPuts(env, waits, producer):
+    '''Process: wait for put events WAITS of PRODUCER, counting the wait in
+its BLOCKED.  BLOCKEDON and BLOCKEDSINCE are set while waiting.'''
+    if waits:
+        producer.blockedOn = waits
+        producer.blockedSince = env.now
+        yield env.all_of(waits)
+        producer.blocked += env.now - producer.blockedSince
+        producer.blockedSince = None
+        producer.blockedOn = None
+
+def blockedTime(producer, now):
+    '''Seconds PRODUCER spent blocked on full queues, including a wait
+still open at NOW.'''
+    if producer.blockedSince is None:
+        return producer.blocked
+    return producer.blocked + (now - producer.blockedSince)
+
+def edgeLink(env, u, v, ud, vd, d):
+    '''Return Link for edge U->V if it crosses hosts and has a bandwidth
+or latency (edge attribute, else configuration), else None.'''
+    if ud['host'] == vd['host']:
+        return None
+    bandwidth = d.get('bandwidth', cfg.get('link_bandwidth'))
+    latency = d.get('latency', cfg.get('link_latency', 0))
+    if not (bandwidth or latency):
+        return None
+    return Link(env, (u,v),
+                None if bandwidth == None else float(bandwidth),
+                float(latency))
 
 class DciInstrument():
     '''Generates data records, such as pictures. '''
+    # Tracing, decided once per run by setupDataflowNetwork()
+    logInfo = False
+    events = None # eventlog.EventLog
+    latency = None # messages.LatencyTracker, if tracing latency
 
-    def __init__(self, env, name, host, cpu, count=5):
+    def __init__(self, env, name, host, cpu, count=5, size=None, delay=None,
+                 key=None, trace=None):
         global cfg
         self.env = env
         self.name = name
@@ -169,28 +634,118 @@ class DciInstrument():
         self.count = count
         self.simType = 's'
         self.outCount = 0
+        self.blocked = 0.0 # seconds spent waiting for full queues
+        self.blockedSince = None # start of the current wait, if blocked
+        self.blockedOn = None # put events waited for, if blocked
 
-        self.start_delay = cfg['image_delay']
+        # Time between records
+        self.delay = delays.Delay(cfg['image_delay']) if delay == None else delay
+        self.size = cfg.get('image_size', 0) if size == None else size
+        # Records of sources with the same KEY and number belong together
+        self.key = key
+        self.trace = trace # observation log to replay (see traces.py)
+        self.nextAt = None # time the next record is due
+        self.resume = None # state restored from a checkpoint (checkpoint.py)
 
-        logging.debug('[DciInstrument] Initializing (%s)'%(self.name,))
+        logging.debug('[DciInstrument] Initializing (%s)', self.name)
 
     def generateData(self, out_pipes):
         '''Generates data records such as pictures, but could be any instrument
         in the telescope. '''
         name = self.name
-        logging.debug('Starting "%s" INSTRUMENT to generate %d files.'
-                      %(name,self.count))
-        for cid in range(self.count):
-            yield self.env.timeout(self.start_delay)
-            msg = '%s.%s.%03d.png' % (self.host,self.name, cid)
-            for out_pipe in out_pipes:
-                out_pipe.put(msg)
+        if (self.resume is not None) and self.resume['blockedOn']:
+            yield from waitPuts(self.env, self.resume['blockedOn'], self)
+        if self.trace != None:
+            yield from self.replayTrace(out_pipes)
+            return
+        logging.debug('Starting "%s" INSTRUMENT to generate %d files.',
+                      name, self.count)
+        for cid in range(self.outCount, self.count):
+            yield self.env.timeout(self.nextDelay())
+            msg = messages.Message('%s.%s.%03d.png'
+                                   % (self.host,self.name, cid),
+                                   self.env.now, size=self.size,
+                                   key=(cid if self.key == None
+                                        else (self.key, cid)))
             self.outCount += 1
-            logging.info('# t=%04d [%s]: Generated data: %s'
-                  %(self.env.now, self.name, msg))
+            yield from putAll(self.env, self.fanOut(msg, out_pipes), self)
+            if self.logInfo:
+                logging.info('# t=%04d [%s]: Generated data: %s',
+                             self.env.now, self.name, msg)
+            if self.events is not None:
+                self.events.event(self.env.now, eventlog.GENERATED,
+                                  self.name, msg)
+
+    def fanOut(self, msg, out_pipes):
+        '''Puts of MSG to all OUT_PIPES.  When tracing latency each branch
+gets its own copy.'''
+        puts = [(out_pipe, msg) for out_pipe in out_pipes]
+        if self.latency is not None:
+            puts[1:] = [(out_pipe, msg.fork()) for out_pipe in out_pipes[1:]]
+        return puts
+
+    def nextDelay(self):
+        'Seconds until the next record (as saved, if resuming).'
+        if self.resume is not None:
+            nextAt = self.resume['nextAt']
+            self.resume = None
+            if (nextAt is not None) and (nextAt >= self.env.now):
+                self.nextAt = nextAt
+                return nextAt - self.env.now
+        delay = self.delay()
+        self.nextAt = self.env.now + delay
+        return delay
+
+    def replayTrace(self, out_pipes):
+        '''Emit the records of the TRACE file at their (relative) times.
+Time lost while blocked on full queues is not made up.'''
+        logging.debug('Starting "%s" INSTRUMENT to replay %s.',
+                      self.name, self.trace)
+        self.traceStart = self.env.now
+        if self.resume is not None:
+            if self.resume['traceStart'] is not None:
+                self.traceStart = self.resume['traceStart']
+            self.resume = None
+        skip = self.outCount
+        for offset, fname, size in traces.readTrace(self.trace):
+            if skip > 0:
+                skip -= 1
+                continue
+            wait = self.traceStart + offset - self.env.now
+            if wait > 0:
+                yield self.env.timeout(wait)
+            msg = messages.Message(fname, self.env.now,
+                                   size=self.size if size == None else size,
+                                   key=traces.recordKey(fname))
+            self.outCount += 1
+            yield from putAll(self.env, self.fanOut(msg, out_pipes), self)
+            if self.logInfo:
+                logging.info('# t=%04d [%s]: Replayed data: %s',
+                             self.env.now, self.name, msg)
+            if self.events is not None:
+                self.events.event(self.env.now, eventlog.GENERATED,
+                                  self.name, msg)
+
+class JoinInput():
+    '''Watcher (see Dataq) of queue input INDEX of all-of join ACTION.
+Indexes messages by key as they are put, while they stay in the queue.'''
+    def __init__(self, action, index):
+        self.action = action
+        self.index = index
+
+    def arrived(self, msg):
+        self.action.joinArrived(self.index, msg)
+
+    def removed(self, msg):
+        self.action.joinRemoved(self.index, msg)
 
 class DciAction():
-    def __init__(self, env, action, cpu, nid, G):
+    # Tracing, decided once per run by setupDataflowNetwork()
+    logInfo = False
+    logDebug = False
+    events = None # eventlog.EventLog
+
+    def __init__(self, env, action, cpu, nid, G, delay=None):
         global cfg
         self.env = env
         self.action = action
@@ -198,27 +753,81 @@ class DciAction():
         #!self.name = self.action.__name__
         self.simType = 'a'
         self.nid = nid
-        self.start_delay = cfg['action_delay'] #  use CRON data!!!
+        # Run time of the action
+        self.delay = delays.Delay(cfg['action_delay']) if delay == None else delay
         #!print('DBG-1',G.node[nid])
         self. cronStr = G.node[nid]['cron'] if 'cron' in G.node[nid] else '* *'
+        self.schedule = cron.schedule(self.cronStr)
+        self.latency = G.graph.get('latency') # LatencyTracker or None
+        self.blocked = 0.0 # seconds spent waiting for full queues
+        self.blockedSince = None # start of the current wait, if blocked
+        self.blockedOn = None # put events waited for, if blocked
+
+        # 'any': fire on a message from any input
+        # 'all': fire when messages with the same key arrived on all inputs
+        self.join = G.node[nid].get('join', 'any')
+        if self.join not in ('any', 'all'):
+            raise ValueError('Node %s: invalid join "%s". Expecting any or all'
+                             % (nid, self.join))
+        self.joinTable = None
+
+        # Failures: try RETRIES more times, waiting BACKOFF seconds (times
+        # 2 for every further retry), then send to FAILPIPE (if any).
+        node = G.node[nid]
+        self.probFail = float(node.get(
+            'probFail',
+            cfg.get('action_prob_fail', {}).get(node['action'],
+                                                cfg.get('prob_fail', 0.0))))
+        self.retries = int(node.get('retries', cfg.get('retries', 0)))
+        self.backoff = float(node.get('backoff', cfg.get('retry_backoff', 60)))
+        self.onFail = node.get('on_fail') # node failed messages go to
+        self.failPipe = None
+        self.failures = 0 # failed attempts
+        self.retried = 0
+        self.gaveUp = 0   # messages that failed every attempt
+        self.wasted = 0.0 # seconds spent on failed attempts
+
+        # Work in hand, saved by checkpoints (see checkpoint.py)
+        self.current = None # message being processed
+        self.pending = dict() # get events (wake mode)
+        self.ready = None # complete sets (all-of join), lists of parts
+        self.joinQueues = None # queue read in place, per input (or None)
+        self.held = None # message taken, waiting for the cron tick
+        self.tickAt = None # time of the cron tick waited for (or last one)
+        self.resume = None # dict(current=, waiting=[]) restored
 
 
 
     def generateAction(self, in_pipes, out_pipes):
-        logging.debug('Starting action generator for "%s"'
-                      %(self.nid))
-
+        logging.debug('Starting action generator for "%s"', self.nid)
+        # Resuming idle: keep the cron tick it was waiting for (or had
+        # passed, if parked on its inputs) at the checkpoint
+        joinAll = (len(in_pipes) > 1) and (self.join == 'all')
+        if joinAll:
+            # Before resuming, so no arrival goes unmatched meanwhile
+            self.joinInputs(in_pipes)
+        tickAt = None
+        if self.resume is not None:
+            if ((self.resume['current'] is None)
+                and not (self.resume['waiting'] or self.resume['blockedOn'])):
+                tickAt = self.resume['tickAt']
+            yield from self.resumeWork(out_pipes)
+
+        if joinAll:
+            yield from self.joinAll(out_pipes, tickAt)
+            return
         if len(in_pipes) > 1:
             logging.warning(
                 'More than 1 input to node "%s". Getting msg from any.'
                 %(self.nid))
 
+        if cfg.get('action_mode', 'poll') == 'wake':
+            yield from self.wakeOnData(in_pipes, out_pipes)
+            return
 
         while True:
-            next_time = cron.next_time(self.env.now,self.cronStr)
-            #!print('DBG-1: (now=%s) generate next data for node=%s at %s (%s)'
-            #!      %(self.env.now, self.nid, next_time, self.cronStr))
-            yield self.env.timeout(next_time)
+            yield self.waitForTick(tickAt)
+            tickAt = None
 
             # Get event for message pipe
             #!msgList = []
@@ -231,48 +840,221 @@ class DciAction():
 
             requests = [in_pipe.get() for in_pipe in in_pipes]
             results = yield self.env.any_of(requests)
-            msg = ','.join(results.values())
-
+            msg = messages.join(list(results.values()))
 
-            logging.debug('[t:%d] DELAY action "%s" for %d seconds'
-                          %(self.env.now,  self.nid, self.start_delay))
-            yield self.env.timeout(self.start_delay)
-            result = self.action(msg)
-            logging.debug('[t:%d] END action "%s"; msg="%s", result="%s"'
-                          %(self.env.now, self.nid, msg, result))
-            for out_pipe in out_pipes:
-                out_pipe.put(result)
+            yield from self.perform(msg, out_pipes)
 
+    def wakeOnData(self, in_pipes, out_pipes):
+        '''Alternative to polling every cron tick: park on the input pipes
+until data arrives, then snap to the next cron boundary.  Get requests
+are kept across cycles, so an idle action costs no events.'''
+        pending = dict() # pending[in_pipe] = outstanding get event
+        self.pending = pending
+        while True:
+            for in_pipe in in_pipes:
+                if in_pipe not in pending:
+                    pending[in_pipe] = in_pipe.get()
+            yield self.env.any_of(list(pending.values()))
+            yield self.waitForTick()
+
+            # Take everything that arrived by the cron boundary
+            msgList = [pending.pop(in_pipe).value
+                       for in_pipe in in_pipes
+                       if pending[in_pipe].triggered]
+            msg = messages.join(msgList)
+
+            yield from self.perform(msg, out_pipes)
+
+    def joinInputs(self, in_pipes):
+        '''Match messages with the same key from every input (all-of join)
+in a JoinTable.  Queue inputs are read in place (see JoinInput): their
+messages stay queued, counting against capacity, until the action takes
+a complete set.  Other inputs (pipes from actions, links) are drained as
+data arrives.  Complete sets wait in READY.'''
+        if self.joinTable is None:
+            self.joinTable = messages.JoinTable(len(in_pipes))
+        if self.ready is None:
+            self.ready = simpy.Store(self.env)
+        # Messages already matched (restored by a checkpoint)
+        known = set(id(msg) for entry in self.joinTable.pending.values()
+                    for slot in entry[1] for msg in slot)
+        known.update(id(msg) for parts in self.ready.items for msg in parts)
+        self.joinQueues = [None] * len(in_pipes)
+        for index, in_pipe in enumerate(in_pipes):
+            if type(in_pipe) is Dataq and in_pipe.watcher is None:
+                self.joinQueues[index] = in_pipe
+                in_pipe.watcher = JoinInput(self, index)
+                for msg in list(in_pipe.items):
+                    if id(msg) not in known:
+                        self.joinArrived(index, msg)
+            else:
+                self.env.process(self.collect(index, in_pipe))
 
-
-def monitorQ(env, dataq, delay=60):
-    if not monitor:
-        return
-    while True:
-        yield env.timeout(delay)
-        feed_graphite('dataq.%s'%dataq.name, len(dataq.items), env.now)
-
+    def joinAll(self, out_pipes, tickAt=None):
+        'Fire for complete sets of the join (see joinInputs), on schedule.'
+        ready = self.ready
+        wake = (cfg.get('action_mode', 'poll') == 'wake')
+        while True:
+            if not wake:
+                yield self.waitForTick(tickAt)
+                tickAt = None
+            parts = yield ready.get()
+            if not self.takeSet(parts):
+                continue
+            msg = messages.join(parts)
+            if wake:
+                self.held = msg
+                yield self.waitForTick()
+                self.held = None
+            yield from self.perform(msg, out_pipes)
+
+    def collect(self, index, in_pipe):
+        'Process: move messages of input INDEX into the join table.'
+        while True:
+            msg = yield in_pipe.get()
+            self.joinArrived(index, msg)
+
+    def joinArrived(self, index, msg):
+        'MSG arrived on input INDEX of an all-of join.'
+        parts = self.joinTable.arrive(index, msg)
+        if parts is not None:
+            self.ready.put(parts)
+
+    def joinRemoved(self, index, msg):
+        '''Queued MSG of input INDEX went away before the action took it:
+forget it, breaking up its complete set if it was in one.'''
+        if self.joinTable.remove(index, msg):
+            return
+        for parts in self.ready.items:
+            if parts[index] is msg:
+                self.ready.items.remove(parts)
+                self.breakSet(parts, [index])
+                return
+
+    def takeSet(self, parts):
+        '''Take the queued PARTS of a complete set out of their queues.  If
+some went away since the set was got from READY, break it up and return
+False.'''
+        gone = [j for (j, q) in enumerate(self.joinQueues)
+                if q is not None and parts[j] not in q.items]
+        if gone:
+            self.breakSet(parts, gone)
+            return False
+        for q, part in zip(self.joinQueues, parts):
+            if q is not None:
+                q.take(part)
+        return True
+
+    def breakSet(self, parts, gone):
+        'Return PARTS of a set, except inputs GONE, to the join table.'
+        self.joinTable.matched -= 1
+        for j, part in enumerate(parts):
+            if j not in gone:
+                self.joinArrived(j, part)
+
+    def resumeWork(self, out_pipes):
+        '''Finish the work in hand when the checkpoint was taken: wait for
+puts it was blocked on, redo the interrupted run, then messages that were
+waiting for a cron tick.'''
+        resume = self.resume
+        self.resume = None
+        tickAt = resume['tickAt']
+        if resume['blockedOn']:
+            yield from waitPuts(self.env, resume['blockedOn'], self)
+            tickAt = None
+        if resume['current'] is not None:
+            yield from self.perform(resume['current'], out_pipes)
+            tickAt = None
+        for msg in resume['waiting']:
+            yield self.waitForTick(tickAt)
+            tickAt = None
+            yield from self.perform(msg, out_pipes)
+
+    def waitForTick(self, tickAt=None):
+        '''Timeout until the next cron tick.  TICKAT (as saved by a
+checkpoint) overrides it; if TICKAT has passed, do not wait.'''
+        now = self.env.now
+        if tickAt is None:
+            tickAt = now + self.schedule.next_time(now)
+        self.tickAt = tickAt
+        return self.env.timeout(max(0, tickAt - now))
+
+    def perform(self, msg, out_pipes):
+        'Run the action on MSG and send its result to all OUT_PIPES.'
+        self.current = msg
+        for attempt in range(self.retries + 1):
+            duration = self.delay()
+            if self.logDebug:
+                logging.debug('[t:%d] DELAY action "%s" for %d seconds',
+                              self.env.now,  self.nid, duration)
+            if self.events is not None:
+                self.events.event(self.env.now, eventlog.START, self.nid, msg)
+            yield from self.cpu.use(duration)
+            try:
+                result = self.action(msg, probFail=self.probFail)
+                break
+            except RuntimeError as err:
+                self.failures += 1
+                self.wasted += duration
+                if self.logInfo:
+                    logging.info('[t:%d] %s (attempt %d of %d)',
+                                 self.env.now, err, attempt+1, self.retries+1)
+                if self.events is not None:
+                    self.events.event(self.env.now, eventlog.FAILED,
+                                      self.nid, msg)
+            if attempt < self.retries:
+                self.retried += 1
+                yield self.env.timeout(self.backoff * 2**attempt)
+        else:
+            self.current = None
+            self.gaveUp += 1
+            if self.events is not None:
+                self.events.event(self.env.now, eventlog.GAVEUP, self.nid, msg)
+            if self.failPipe is not None:
+                yield from putAll(self.env, [(self.failPipe, msg)], self)
+            return
+
+        self.current = None
+        # Rendering composite messages is not free: only when tracing
+        if self.logDebug:
+            logging.debug('[t:%d] END action "%s"; msg="%s", result="%s"',
+                          self.env.now, self.nid, msg, result)
+        if self.events is not None:
+            self.events.event(self.env.now, eventlog.END, self.nid, result)
+        if result is None:
+            return # no inputs, so nothing to pass on
+        puts = [(out_pipe, result) for out_pipe in out_pipes]
+        if self.latency is not None:
+            self.latency.stage(self.nid, result.hop(self.nid, self.env.now))
+            puts[1:] = [(out_pipe, result.fork())
+                        for out_pipe in out_pipes[1:]]
+        yield from putAll(self.env, puts, self)
+
+
+
+def sinkNodes(G):
+    'Nodes where data ends up: terminals, and queues nobody reads from.'
+    plan = G.graph['plan']
+    return [plan['nodes'][i] for i in plan['sinks']]
 
 def printGraphSummary(G):
     logging.info('Graph summary:')
     logging.info(nx.info(G))
 
+    plan = G.graph['plan']
+    nodes = plan['nodes']
+    hasPipe = [('pipe' in G[nodes[u]][nodes[v]])
+               for (u,v,etype) in plan['edges']]
     nodeTypeCnt = defaultdict(int) # diag!!!
-    for n,d in G.nodes_iter(data=True):
-        ntype = d.get('type')
-        nodeTypeCnt[ntype] += 1 # diag!!!
-        in_pipes = [d0['pipe']
-                    for u,v,d0 in G.in_edges(n,data=True)
-                    if ('pipe' in d0)]
-        out_pipes = [d1['pipe']
-                     for u,v,d1 in G.out_edges(n,data=True)
-                     if ('pipe' in d1) ]
+    for i,n in enumerate(nodes):
+        nodeTypeCnt[plan['types'][i]] += 1 # diag!!!
         logging.info('Node %8s: num in,out-pipes=(%d,%d)'
-                     %(n,len(in_pipes),len(out_pipes)))
+                     %(n,
+                       sum(hasPipe[j] for j in plan['inEdges'][i]),
+                       sum(hasPipe[j] for j in plan['outEdges'][i])))
 
     edgeTypeCnt = defaultdict(int) # diag!!!
-    for u,v,d in G.edges_iter(data=True):
-        etype = G.node[u]['type'] + G.node[v]['type']
+    for u,v,etype in plan['edges']:
         edgeTypeCnt[etype] += 1 # diag!!!
 
     logging.info('nodeTypeCnt: %s'
@@ -282,84 +1064,142 @@ def printGraphSummary(G):
           % ', '.join(['%s=%d'%(k,v) for (k,v) in edgeTypeCnt.items()]))
 
 
-def setupDataflowNetwork(env, dotfile, draw=False, profile=False):
-    random.seed(42) # make it reproducible?
+def setupDataflowNetwork(env, dotfile, draw=False, profile=False, seed=42,
+                         cachedir=literate.defaultCacheDir, metricsFile=None,
+                         latency=False, eventsFile=None):
+    random.seed(seed) # make it reproducible
     createdProcesses = 0
 
-    G = literate.loadDataflow(dotfile,'sdm-data-flow.graphml')
+    # Logging levels are checked once here, not on every simulated event
+    logInfo = logging.getLogger().isEnabledFor(logging.INFO)
+    logDebug = logging.getLogger().isEnabledFor(logging.DEBUG)
+    events = eventlog.EventLog(eventsFile) if eventsFile else None
+
+    G = literate.loadCompiledDataflow(dotfile, cachedir=cachedir)
+    analysis.logAnalysis(analysis.analyzeGraph(G, cfg, withFlow=logInfo))
     if draw:
         print('Displaying dataflow graph')
         fig = literate.drawDfGraph(G)
     #! print('Content of loaded graph:')
     #! pprint(G.nodes(data=True))
 
+    if latency:
+        G.graph['latency'] = messages.LatencyTracker()
+
+    plan = G.graph['plan']
+    nodes = plan['nodes']
+    types = plan['types']
+    nodeData = [G.node[n] for n in nodes]
+    sinks = set(plan['sinks'])
+
     ##
     ## Stuff sim instances into graph NODES
     ##
     cpuLUT = dict() # cpuLUT[hostname] = resource
     noNodeSimCnt = defaultdict(int) # dict[ntype] = count
-    for n,d in G.nodes_iter(data=True):
-        cpu = cpuLUT.setdefault(d['host'], simpy.Resource(env))
-        ntype = d.get('type')
+    sims = [None] * len(nodes) # sims[i] = sim instance of nodes[i]
+    for i,n in enumerate(nodes):
+        d = nodeData[i]
+        if d['host'] not in cpuLUT:
+            cpuLUT[d['host']] = HostCpu(env, d['host'], hostCores(d['host']))
+        cpu = cpuLUT[d['host']]
+        ntype = types[i]
 
         # Map node types to Simpy instances (not exhaustive)
         if ntype == 's':
-            d['sim'] = DciInstrument(env,d['source'],d['host'], cpu) #!!!
+            d['sim'] = DciInstrument(env,d['source'],d['host'], cpu,
+                                     count=int(d.get('count', 5)),
+                                     size=d.get('size'),
+                                     delay=delays.Delay(
+                                         d.get('delay', cfg['image_delay']),
+                                         seed=seed, key=n),
+                                     key=d.get('key'),
+                                     trace=d.get('trace')) #!!!
         elif ntype == 'q':
-            d['sim'] = Dataq(env,'%s.%s'%(d['host'],n))
+            # Queues nobody reads from stand for the final destination
+            # (e.g. the archive), so they are only bounded on request.
+            capacity = d.get('capacity',
+                             None if i in sinks
+                             else cfg.get('queue_capacity'))
+            d['sim'] = Dataq(env,'%s.%s'%(d['host'],n),
+                             capacity=(float('inf') if capacity == None
+                                       else int(capacity)),
+                             profile=profile,
+                             policy=d.get('policy',
+                                          cfg.get('queue_policy', 'block')))
         elif ntype == 'a':
-            if hasattr(actions,d['action']):
-                func = eval('actions.'+d['action'])
-            else:
+            func = getattr(actions, d['action'], None)
+            if func == None:
                 func = functools.partial(actions.nop,name=d['action'])
-            d['sim'] = DciAction(env, func, cpu, n, G)
+            d['sim'] = DciAction(env, func, cpu, n, G,
+                                 delay=delays.Delay(
+                                     d.get('delay', cfg['action_delay']),
+                                     seed=seed, key=n))
         elif ntype == 't':
             #!d['sim'] = simpy.Container(env)
-            d['sim'] = Dataq(env,'%s.%s'%(d['host'],n))
+            d['sim'] = Dataq(env,'%s.%s'%(d['host'],n), profile=profile)
         else:
             noNodeSimCnt[ntype] += 1
+        sims[i] = d.get('sim')
+        if ntype == 's':
+            sims[i].latency = G.graph.get('latency')
+        if ntype in ('s', 'a'):
+            sims[i].logInfo = logInfo
+            sims[i].logDebug = logDebug
+            sims[i].events = events
 
     #!if len(noNodeSimCnt) > 0:
     #!    print('WARNING: No simulation for some nodes.  (type=count): %s'
     #!          %(', '.join(['%s=%d'%(k,v) for k,v in noNodeSimCnt.items()])))
 
     if profile:
-        addProfiling(G)
+        G.graph['profileCollected'] = True
 
     ##
     ## Stuff sim instances into graph EDGES
     ##
     # Create "link" elements of simulation based upon type of edge
     # Edge type is ordered character pair of black/white node type.
-    for u,v,d in G.edges_iter(data=True):
-        ud = G.node[u]
-        vd = G.node[v]
-        etype = ud['type'] + vd['type']
+    links = list() # network links between hosts
+    # What the receiving (inEnds) and sending (outEnds) node of each edge
+    # uses: the pipe, or one end of a link.  None if the edge has no pipe.
+    inEnds = [None] * len(plan['edges'])
+    outEnds = [None] * len(plan['edges'])
+    noEdgeSimCnt = defaultdict(int) # dict[ntype] = count
+    for j,(ui,vi,etype) in enumerate(plan['edges']):
+        u = nodes[ui]
+        v = nodes[vi]
+        d = G[u][v]
 
         # Map edge types to Simpy "connection instances" (not exhaustive)
-        noEdgeSimCnt = defaultdict(int) # dict[ntype] = count
         if etype == 'sa':
-            d['pipe'] = simpy.Store(env,capacity=1)
-            if not hasattr(simpy.Store,'instances'):
-                simpy.Store.instances = []
-            simpy.Store.instances.append(d['pipe'])
-            d['pipe'].edge=(u,v)
+            d['pipe'] = Pipe(env, (u,v), profile=profile)
         elif etype == 'aa':
-            d['pipe'] = simpy.Store(env,capacity=1)
-            if not hasattr(simpy.Store,'instances'):
-                simpy.Store.instances = []
-            simpy.Store.instances.append(d['pipe'])
-            d['pipe'].edge=(u,v)
+            d['pipe'] = Pipe(env, (u,v), profile=profile)
         elif etype == 'qa':
-            d['pipe'] = ud['sim']
+            d['pipe'] = sims[ui]
         elif etype == 'at':
-            d['pipe'] = vd['sim']
+            d['pipe'] = sims[vi]
         elif etype == 'aq':
-            d['pipe'] = vd['sim']
+            d['pipe'] = sims[vi]
         elif etype == 'sq':
-            d['pipe'] = vd['sim']
+            d['pipe'] = sims[vi]
         else:
             noEdgeSimCnt[etype] += 1
+            continue
+        inEnds[j] = outEnds[j] = d['pipe']
+
+        if etype in ('aa', 'qa', 'aq'):
+            link = edgeLink(env, u, v, nodeData[ui], nodeData[vi], d)
+            if link != None:
+                d['link'] = link
+                links.append(link)
+                # Data from a queue on another host is pulled over the
+                # link, data to another host is pushed over it.
+                if etype == 'qa':
+                    inEnds[j] = LinkReceiver(link, d['pipe'])
+                else:
+                    outEnds[j] = LinkSender(link, d['pipe'])
 
     #!if len(noEdgeSimCnt) > 0:
     #!    print('WARNING: No simulation for some edges.  (type=count): %s'
@@ -370,105 +1210,149 @@ def setupDataflowNetwork(env, dotfile, draw=False, profile=False):
     ##
     ## Create simulation processes
     ##
-    for n,d in G.nodes_iter(data=True):
-        cpu = cpuLUT.setdefault(d['host'], simpy.Resource(env))
-
-        if d.get('type') == 's':
-            out_pipes = [d1['pipe']
-                         for u,v,d1 in G.out_edges(n,data=True)
-                         if ('pipe' in d1) ]
+    G.graph['cpus'] = cpuLUT
+    G.graph['links'] = links
+    G.graph['events'] = events
+    for i,n in enumerate(nodes):
+        ntype = types[i]
+        if ntype == 's':
+            out_pipes = [outEnds[j] for j in plan['outEdges'][i]
+                         if outEnds[j] is not None]
 
-            env.process(d['sim'].generateData(out_pipes))
+            env.process(sims[i].generateData(out_pipes))
             createdProcesses += 1
-            logging.info('Create DATA generator for %s. Out=%s'
-                  %(n,out_pipes))
+            logging.info('Create DATA generator for %s. Out=%s', n, out_pipes)
 
-        elif d.get('type') == 'q':
+        elif ntype == 'q':
             if monitor:
-                env.process( monitorQ(env, d['sim'] ))
-                createdProcesses += 1
-        elif d.get('type') == 'a':
-            in_pipes = [d0['pipe']
-                        for u0,v0,d0 in G.in_edges(n,data=True)
-                        if ('pipe' in d0)]
-            out_pipes = [d1['pipe']
-                         for u,v,d1 in G.out_edges(n,data=True)
-                         if ('pipe' in d1) ]
-            env.process(d['sim'].generateAction(in_pipes, out_pipes))
-            logging.info('Create ACTION generator for %s. in=%s out=%s'
-                  %(n,
-                    [r.__class__.__name__ for r in in_pipes],
-                    [r.__class__.__name__ for r in out_pipes]))
+                sims[i].observers.append(graphiteObserver)
+                graphiteObserver(sims[i])
+        elif ntype == 'a':
+            sim = sims[i]
+            in_pipes = [inEnds[j] for j in plan['inEdges'][i]
+                        if inEnds[j] is not None]
+            out_pipes = []
+            for j in plan['outEdges'][i]:
+                if outEnds[j] is None:
+                    continue
+                if nodes[plan['edges'][j][1]] == sim.onFail:
+                    sim.failPipe = outEnds[j]
+                else:
+                    out_pipes.append(outEnds[j])
+            if (sim.onFail != None) and (sim.failPipe == None):
+                raise RuntimeError('Node %s: on_fail=%s is not an output'
+                                   % (n, sim.onFail))
+            env.process(sim.generateAction(in_pipes, out_pipes))
+            if logInfo:
+                logging.info('Create ACTION generator for %s. in=%s out=%s',
+                             n,
+                             [r.__class__.__name__ for r in in_pipes],
+                             [r.__class__.__name__ for r in out_pipes])
             createdProcesses += 1
-        elif d.get('type') == 't':
+        elif ntype == 't':
             pass
-        elif d.get('type') == 'd':
+        elif ntype == 'd':
             pass
         else:
-            print('WARNING!!! Unexpected node type: "%s"'%(d.get('type')))
-
-    logging.info('Created %d processes'%(createdProcesses,))
+            print('WARNING!!! Unexpected node type: "%s"'%(ntype))
+
+    if metricsFile:
+        queues = [sims[i] for i in range(len(nodes)) if types[i] == 'q']
+        recorder = metrics.MetricsRecorder(
+            metricsFile, ['dataq.%s' % q.name for q in queues])
+        for i,q in enumerate(queues):
+            observe = recorder.observer(i)
+            q.observers.append(observe)
+            observe(q) # initial depth
+        G.graph['metrics'] = recorder
+
+    if latency:
+        for i in plan['sinks']:
+            sims[i].observers.append(G.graph['latency'].arrived)
+
+    logging.info('Created %d processes', createdProcesses)
     #!print('Content of sim annotated graph:')
     #!print('  NODES:')
     #!pprint(G.nodes(data=True))
     #!print('  EDGES:')
     #!pprint(G.edges(data=True))
 
-    logging.debug('%d processes started'%(createdProcesses))
-    logging.debug('Next event starts at: %s'%(env.peek()))
+    logging.debug('%d processes started', createdProcesses)
+    logging.debug('Next event starts at: %s', env.peek())
 
     return G
     # END setupDataflowNetwork()
 
 
 
-def addProfiling(G):
-    simpy.Container.instances = list()
-    Dataq.instances = list()
-
-
-    # Monkey patch PUT to count messages
-    if not hasattr(Dataq,'monkey'):
-        origDataqPut = Dataq.put
-        def putDataqWithCount(self,data):
-            instance = self
-            setattr(instance,'putcount', 1 + getattr(instance,'putcount',0))
-            res = origDataqPut(self,data)
-            instance.hiwater = max(getattr(instance,'hiwater',0),
-                                   len(instance.items))
-            return res
-        Dataq.put = putDataqWithCount
-        setattr(Dataq,'monkey',True)
-
-    if not hasattr(simpy.Store,'monkey'):
-        origStorePut = simpy.Store.put
-        def putStoreWithCount(self,data):
-            instance = self
-            setattr(instance,'putcount', 1 + getattr(instance,'putcount',0))
-            logging.debug('Set simpy.Store %s pcount=%d'
-                          %(instance, getattr(instance,'putcount',-1)))
-            return origStorePut(self,data)
-        simpy.Store.put = putStoreWithCount
-        setattr(simpy.Store,'monkey',True)
-
-
+def collectStats(env, G):
+    '''Return per-queue statistics of a finished (profiled) simulation as
+plain data (picklable, so it can be returned from a worker process).'''
+    queues = dict()
+    terminals = [G.node[n]['sim'].name for n in sinkNodes(G)]
     for n,d in G.nodes_iter(data=True):
-        if 'sim' not in d:
-            continue
-
-        si = d['sim']
-        if isinstance(si,DciAction):
-            pass
-        elif isinstance(si,Dataq):
-            Dataq.instances.append(si)
-        elif isinstance(si, simpy.Store):
-            simpy.Store.instances.append(si)
-        elif isinstance(si,DciInstrument):
-            pass
-    #!print('Dataq.instances = ',Dataq.instances)
-
-    G.graph['profileCollected'] = True
-    # END addProfiling
+        if ('sim' in d) and isinstance(d['sim'], Dataq):
+            q = d['sim']
+            queues[q.name] = dict(puts=q.stats.puts,
+                                  gets=q.stats.gets,
+                                  hiwater=q.stats.hiwater,
+                                  mean_depth=q.stats.meanDepth(env.now),
+                                  mean_wait=q.stats.meanWait(),
+                                  backlog=len(q.items),
+                                  drops=q.drops)
+    delivered = sum(queues[name]['backlog'] for name in terminals)
+    hosts = dict()
+    for host, cpu in G.graph['cpus'].items():
+        util = cpu.utilization(env.now)
+        hosts[host] = dict(busy=cpu.busy,
+                           runs=cpu.runs,
+                           mean_wait=cpu.meanWait(),
+                           max_wait=cpu.waitMax)
+        if util != None:
+            hosts[host]['util'] = util
+    links = dict()
+    for link in G.graph['links']:
+        links['%s->%s' % link.edge] = dict(sent=link.sent,
+                                           mbytes=link.bytes / 1e6,
+                                           util=link.utilization(env.now),
+                                           mean_wait=link.meanWait())
+    blocked = dict((n, blockedTime(d['sim'], env.now))
+                   for n,d in G.nodes_iter(data=True)
+                   if hasattr(d.get('sim'), 'blocked'))
+    failures = dict()
+    for n,d in G.nodes_iter(data=True):
+        if getattr(d.get('sim'), 'probFail', 0) > 0:
+            sim = d['sim']
+            failures[n] = dict(failures=sim.failures,
+                               retried=sim.retried,
+                               gave_up=sim.gaveUp,
+                               wasted=sim.wasted)
+    return dict(end=env.now, queues=queues, terminals=terminals,
+                delivered=delivered, hosts=hosts, links=links,
+                blocked=blocked, failures=failures)
+
+
+def simulate(job):
+    '''Run one complete simulation. Used as process pool worker.
+JOB:: dict(dotfile=, end=, seed=, cfg=, cachedir=, steady=)
+STEADY:: None (run until END), or dict(batch=, precision=) to stop early
+once steady state estimates are that precise; the estimates after the
+warm-up are then added (see steady.SteadyState.collectStats).'''
+    global cfg
+    cfg = job['cfg']
+    env = simpy.Environment()
+    G = setupDataflowNetwork(env, job['dotfile'], profile=True,
+                             seed=job['seed'], cachedir=job['cachedir'])
+    state = None
+    if job.get('steady'):
+        state = steady.runUntilSteady(env, G, job['end'], **job['steady'])
+    else:
+        env.run(until=job['end'])
+    stats = collectStats(env, G)
+    if state is not None:
+        stats.update(state.collectStats())
+    stats['seed'] = job['seed']
+    return stats
 
 
 
@@ -485,11 +1369,29 @@ def main():
         )
     parser.add_argument('--version', action='version',  version='1.1.0')
     parser.add_argument('--profile', action='store_true')
+    parser.add_argument('--latency', action='store_true',
+                        help='Trace messages and report end-to-end and'
+                        ' per-stage latency')
     parser.add_argument('--end',
                         help='Time (seconds) to end simulation [default=%s]'
                         %(default_end),
                         type = int,
                         default = default_end,)
+    parser.add_argument('--until-steady', action='store_true',
+                        help='Stop when queue statistics reach steady state'
+                        ' (--end is then the longest run); implies --profile')
+    parser.add_argument('--precision', type=float, default=0.05,
+                        help='Relative 95%% confidence half width that steady'
+                        ' state estimates must reach [default=%(default)s]')
+    parser.add_argument('--batch', type=float, default=600,
+                        help='Seconds per steady state batch'
+                        ' [default=%(default)s]')
+    parser.add_argument('--analytic', action='store_true',
+                        help='Do not simulate; print a queueing network'
+                        ' estimate (with --sweep: one row per point)')
+    parser.add_argument('--analyze', action='store_true',
+                        help='Do not simulate; print throughput bound'
+                        ' (max-flow), host loads and unreachable queues')
     parser.add_argument('--summarize',
                         default=[],
                         action='append')
@@ -501,6 +1403,65 @@ def main():
     parser.add_argument('--graphite', type=argparse.FileType('w'),
                         help='Output for GRAPHITE plotter'
                         )
+    parser.add_argument('--metrics', type=argparse.FileType('wb'),
+                        help='Output (binary, columnar) for queue depths,'
+                        ' recorded whenever they change.'
+                        ' Convert with queue_matrix.py')
+    parser.add_argument('--events', type=argparse.FileType('wb'),
+                        help='Output (binary) log of every generated record'
+                        ' and action run. Print with'
+                        ' "python -m daflsim.eventlog"')
+    parser.add_argument('--checkpoint-at',
+                        help='Simulated time to save a checkpoint at'
+                        ' (repeat for several)',
+                        type=float,
+                        default=[],
+                        action='append')
+    parser.add_argument('--checkpoint',
+                        help='Checkpoint files are named PREFIX.<time>.ckpt'
+                        ' [default=%(default)s]',
+                        default='daflsim')
+    parser.add_argument('--resume', type=argparse.FileType('rb'),
+                        help='Continue from checkpoint file (with --cfg,'
+                        ' under a changed configuration)')
+    parser.add_argument('--seed',
+                        help='Random seed (first seed of replications)'
+                        ' [default=%(default)s]',
+                        type=int,
+                        default=42)
+    parser.add_argument('--replications',
+                        help='Run N independently seeded simulations and'
+                        ' summarize queue statistics over them',
+                        type=int,
+                        default=0)
+    parser.add_argument('--workers',
+                        help='Number of worker processes for replications'
+                        ' and sweeps [default=number of CPUs]',
+                        type=int)
+    parser.add_argument('--sweep',
+                        help='Sweep a configuration parameter. '
+                        'NAME=v1,v2,... or NAME=start:stop:step. '
+                        'Repeat for a grid over several parameters.',
+                        default=[],
+                        action='append')
+    parser.add_argument('--sweep-out',
+                        help='Output (CSV) for sweep results [default=stdout]',
+                        type=argparse.FileType('w'),
+                        default=sys.stdout)
+
+    parser.add_argument('--action-mode',
+                        help='How idle actions wait for work: "poll" wakes'
+                        ' every cron tick, "wake" parks until data arrives'
+                        ' and then waits for the next cron tick'
+                        ' [default=cfg action_mode]',
+                        choices=['poll', 'wake'])
+    parser.add_argument('--graph-cache',
+                        help='Directory for compiled dataflow graphs'
+                        ' [default=%(default)s]',
+                        default=literate.defaultCacheDir)
+    parser.add_argument('--no-graph-cache', dest='graph_cache',
+                        help='Always parse the dot file',
+                        action='store_const', const=None)
 
     parser.add_argument('--loglevel',      help='Kind of diagnostic output',
                         choices=['CRTICAL', 'ERROR', 'WARNING',
@@ -523,23 +1484,114 @@ def main():
                         )
     logging.debug('Debug output is enabled in %s !!!', sys.argv[0])
 
+    snap = checkpoint.load(args.resume) if args.resume else None
     if args.cfg:
-        cfg = json.load(args.cfg)
+        cfg = dict(defaultCfg.cfg)
+        cfg.update(json.load(args.cfg))
+    elif snap and snap['cfg']:
+        cfg = snap['cfg']
+    if args.action_mode:
+        cfg = dict(cfg, action_mode=args.action_mode)
+    steadyOpts = None
+    if args.until_steady:
+        args.profile = True
+        steadyOpts = dict(batch=args.batch, precision=args.precision)
+
+    if len(args.sweep) > 0:
+        try:
+            points = sweep.expandGrid(args.sweep, cfg)
+        except ValueError as err:
+            parser.error(str(err))
+        if args.analytic:
+            G = literate.loadCompiledDataflow(args.infile,
+                                              cachedir=args.graph_cache)
+            rows = [analytic.resultRow(params, G,
+                                       analytic.solveNetwork(G, pcfg))
+                    for (params, pcfg) in points]
+            paramNames = [sweep.parseSweepSpec(spec)[0] for spec in args.sweep]
+            analytic.writeTable(rows, args.sweep_out, paramNames)
+            return
+        seeds = [args.seed + i for i in range(max(1, args.replications))]
+        jobs = [dict(dotfile=args.infile.name, end=args.end, seed=seed,
+                     cfg=pcfg, cachedir=args.graph_cache, steady=steadyOpts)
+                for (params, pcfg) in points
+                for seed in seeds]
+        results = replicate.runJobs(simulate, jobs, workers=args.workers)
+        paramsList = [params for (params, pcfg) in points for seed in seeds]
+        rows = [sweep.resultRow(params, stats)
+                for (params, stats) in zip(paramsList, results)]
+        paramNames = [sweep.parseSweepSpec(spec)[0] for spec in args.sweep]
+        sweep.writeTable(rows, args.sweep_out, paramNames,
+                         steady=args.until_steady)
+        return
+
+    if args.replications > 0:
+        jobs = [dict(dotfile=args.infile.name, end=args.end,
+                     seed=args.seed + i, cfg=cfg, cachedir=args.graph_cache,
+                     steady=steadyOpts)
+                for i in range(args.replications)]
+        results = replicate.runJobs(simulate, jobs, workers=args.workers)
+        replicate.printReplicationHeader(results)
+        replicate.printReplicationSummary(replicate.mergeQueueStats(results))
+        replicate.printReplicationSummary(
+            replicate.mergeQueueStats(results, section='hosts'), title='Host')
+        linkStats = replicate.mergeQueueStats(results, section='links')
+        if len(linkStats) > 0:
+            replicate.printReplicationSummary(linkStats, title='Link')
+        failStats = replicate.mergeQueueStats(results, section='failures')
+        if len(failStats) > 0:
+            replicate.printReplicationSummary(failStats, title='Action')
+        if args.until_steady:
+            replicate.printSteadySummary(results)
+        return
+
+    if args.analyze:
+        G = literate.loadCompiledDataflow(args.infile,
+                                          cachedir=args.graph_cache)
+        analysis.printReport(analysis.analyzeGraph(G, cfg))
+        return
+
+    if args.analytic:
+        G = literate.loadCompiledDataflow(args.infile,
+                                          cachedir=args.graph_cache)
+        analytic.printReport(analytic.solveNetwork(G, cfg))
+        return
 
     if args.graphite:
         monitor = Monitor(args.graphite)
 
-    env = simpy.Environment()
-    G = setupDataflowNetwork(env, args.infile, profile=args.profile)
+    env = simpy.Environment(initial_time=snap['time'] if snap else 0)
+    G = setupDataflowNetwork(env, args.infile, profile=args.profile,
+                             seed=args.seed, cachedir=args.graph_cache,
+                             metricsFile=args.metrics, latency=args.latency,
+                             eventsFile=args.events)
+    if snap:
+        checkpoint.restore(env, G, snap)
 
     if args.loglevel == 'DEBUG':
         printGraphSummary(G)
 
-    env.run(until=args.end)
+    for t in sorted(args.checkpoint_at):
+        if t == int(t):
+            t = int(t)
+        if env.now < t < args.end:
+            env.run(until=t)
+            with open('%s.%d.ckpt' % (args.checkpoint, t), 'wb') as f:
+                checkpoint.save(env, G, f, cfg=cfg, seed=args.seed)
+    if args.until_steady:
+        state = steady.runUntilSteady(env, G, args.end, **steadyOpts)
+    else:
+        env.run(until=args.end)
     print_summary(env, G, summarizeNodes=args.summarize)
+    if args.until_steady:
+        state.printReport()
 
     if args.graphite:
         monitor.close()
+    if args.metrics:
+        G.graph['metrics'].close()
+    if args.events:
+        G.graph['events'].close()
 
 if __name__ == '__main__':
     main()
@@ -1,7 +1,17 @@
 
 cfg = dict(
-    queue_capacity = 41,  # max number of records in queue
-    monitor_interval = 1, # seconds between checking queue
+    queue_capacity = 41,  # max number of records in queue (None = unlimited)
+    queue_policy = 'block', # full queue: 'block', 'drop-new' or 'drop-old'
     image_delay = 5,
     action_delay = 5,
+    action_mode = 'poll', # 'poll' every cron tick, or 'wake' on data
+    default_cores = None, # CPU cores per host (None = unlimited)
+    host_cores = dict(),  # host_cores[hostname] = cores (overrides default)
+    image_size = 10e6,    # bytes per generated record (overridden by SIZE)
+    link_bandwidth = None, # bytes/sec between hosts (None = unlimited)
+    link_latency = 0,     # seconds between hosts
+    prob_fail = 0.0,      # probability that one run of an action fails
+    action_prob_fail = dict(), # action_prob_fail[action] = prob (overrides)
+    retries = 0,          # retries of a failed action before giving up
+    retry_backoff = 60,   # seconds before first retry (doubles each retry)
     )
@@ -0,0 +1,100 @@
+'''\
+Delay (duration) distributions of sources and actions.
+
+A delay spec (node "delay=" attribute, or image_delay/action_delay in the
+configuration) is one of:
+  5                          fixed, seconds
+  ('exponential', mean)
+  ('lognormal', mu, sigma)   mu, sigma of the underlying normal
+  ('empirical', 'file')      resample measured durations (one per line)
+'''
+
+import zlib
+
+import numpy as np
+
+# Samples of empirical distributions, by file name
+empiricalSamples = dict()
+
+
+def loadEmpirical(filename):
+    if filename not in empiricalSamples:
+        values = np.atleast_1d(np.loadtxt(filename, dtype=float))
+        if len(values) == 0:
+            raise ValueError('No durations in "%s"' % (filename,))
+        empiricalSamples[filename] = values
+    return empiricalSamples[filename]
+
+
+class Delay():
+    '''Callable returning one delay sample of SPEC per call.
+
+Random samples are drawn BATCH at a time from a generator seeded by SEED
+and KEY (e.g. the node name), so every node has its own reproducible
+stream no matter in what order nodes are created.'''
+    def __init__(self, spec, seed=None, key='', batch=1024):
+        if isinstance(spec, (list, tuple)):
+            kind, params = spec[0], tuple(spec[1:])
+        else:
+            kind, params = 'fixed', (spec,)
+        self.spec = spec
+        self.kind = kind
+        self.batch = batch
+        self.samples = []
+        self.index = 0
+
+        if kind == 'fixed':
+            self.fixed = float(params[0])
+            return
+        self.fixed = None
+        if kind == 'exponential':
+            (scale,) = params
+            self.draw = lambda n: self.rng.exponential(scale, n)
+        elif kind == 'lognormal':
+            mu, sigma = params
+            self.draw = lambda n: self.rng.lognormal(mu, sigma, n)
+        elif kind == 'empirical':
+            (filename,) = params
+            values = loadEmpirical(filename)
+            self.draw = lambda n: self.rng.choice(values, n)
+        else:
+            raise ValueError('Unknown delay distribution "%s" in %s. '
+                             'Expecting one of: fixed, exponential, '
+                             'lognormal, empirical' % (kind, spec))
+        self.rng = np.random.default_rng([seed or 0,
+                                          zlib.crc32(str(key).encode())])
+
+    def __call__(self):
+        if self.fixed is not None:
+            return self.fixed
+        i = self.index
+        if i == len(self.samples):
+            self.samples = self.draw(self.batch).tolist()
+            i = 0
+        self.index = i + 1
+        return self.samples[i]
+
+    def getState(self):
+        'Picklable position in the random stream (None for fixed delays).'
+        if self.fixed is not None:
+            return None
+        return dict(rng=self.rng.bit_generator.state,
+                    samples=list(self.samples), index=self.index)
+
+    def setState(self, state):
+        if state is None or self.fixed is not None:
+            return
+        self.rng.bit_generator.state = state['rng']
+        self.samples = list(state['samples'])
+        self.index = state['index']
+
+    def mean(self):
+        'Expected value of the distribution.'
+        if self.kind == 'fixed':
+            return self.fixed
+        if self.kind == 'exponential':
+            return float(self.spec[1])
+        if self.kind == 'lognormal':
+            mu, sigma = self.spec[1:]
+            return float(np.exp(mu + sigma*sigma/2))
+        return float(loadEmpirical(self.spec[1]).mean())
@@ -0,0 +1,125 @@
+#! /usr/bin/env python3
+'''\
+Binary log of simulation events, for runs that need a full trace without
+paying for text formatting while the simulation runs.
+
+The file is a stream of little-endian records:
+  magic                  b'DAFLEV2\n' (once)
+  code, time, node, n    struct "<HdIH" per event, then
+  msg                    N ids ("<I" each), one per part of the message
+  NAME, id, length, utf8 the text of string ID, written before its use
+NODE and MSG are ids of strings (node and message names).  A composite
+message is logged as the names of its (non composite) parts.  Ids are
+reused for other strings once they drop out of the MAXNAMES most recently
+used, so memory does not grow with the length of the run; a string is
+written again if it comes back.
+Decode with readEvents(), or: python -m daflsim.eventlog events.bin
+'''
+
+import argparse
+import struct
+from collections import OrderedDict
+
+magic = b'DAFLEV2\n'
+record = struct.Struct('<HdIH')
+nameHeader = struct.Struct('<HII')
+partId = struct.Struct('<I')
+
+# Event codes
+GENERATED, START, END, FAILED, GAVEUP = range(5)
+NAME = 0xFFFF
+eventNames = ['generated', 'start', 'end', 'failed', 'gaveup']
+
+
+class EventLog():
+    '''Write events to binary OUTFILE, buffering BUFSIZE bytes.'''
+    def __init__(self, outfile, bufsize=1 << 16, maxNames=1 << 16):
+        self.file = outfile
+        self.bufsize = bufsize
+        self.buf = bytearray(magic)
+        self.maxNames = maxNames
+        self.ids = OrderedDict() # ids[string] = id, least recently used first
+        self.count = 0
+
+    def nameId(self, name):
+        ids = self.ids
+        sid = ids.get(name)
+        if sid is not None:
+            ids.move_to_end(name)
+            return sid
+        if len(ids) < self.maxNames:
+            sid = len(ids)
+        else:
+            sid = ids.popitem(last=False)[1]
+        ids[name] = sid
+        text = name.encode('utf-8')
+        self.buf += nameHeader.pack(NAME, sid, len(text))
+        self.buf += text
+        return sid
+
+    def event(self, time, code, node, msg):
+        '''Record event CODE of NODE (name) on MSG (a messages.Message, or
+None).'''
+        nodeId = self.nameId(node)
+        if msg is None:
+            names = ()
+        elif msg.parts is None:
+            names = (msg.name,)
+        else:
+            names = msg.leafNames()
+        msgIds = [self.nameId(name) for name in names]
+        self.buf += record.pack(code, time, nodeId, len(msgIds))
+        for sid in msgIds:
+            self.buf += partId.pack(sid)
+        self.count += 1
+        if len(self.buf) >= self.bufsize:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buf)
+        self.buf = bytearray()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def readEvents(infile):
+    '''Generator of (time, event name, node, msg) from binary INFILE. MSG
+is the names of the parts of the message, joined by commas.'''
+    if infile.read(len(magic)) != magic:
+        raise ValueError('Not an event log: %s' % (infile.name,))
+    names = dict()
+    while True:
+        head = infile.read(2)
+        if len(head) < 2:
+            return
+        (code,) = struct.unpack('<H', head)
+        if code == NAME:
+            rest = infile.read(nameHeader.size - 2)
+            code, sid, length = nameHeader.unpack(head + rest)
+            names[sid] = infile.read(length).decode('utf-8')
+            continue
+        rest = infile.read(record.size - 2)
+        code, time, node, count = record.unpack(head + rest)
+        msgIds = struct.unpack('<%dI' % count, infile.read(4 * count))
+        yield (time, eventNames[code], names[node],
+               ','.join(names[sid] for sid in msgIds))
+
+
+##############################################################################
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Print a binary event log (daflsim --events) as text',
+        epilog='EXAMPLE: %(prog)s events.bin'
+        )
+    parser.add_argument('infile', type=argparse.FileType('rb'),
+                        help='Event log written by daflsim --events')
+    args = parser.parse_args()
+
+    for time, event, node, msg in readEvents(args.infile):
+        print('%.3f %s %s %s' % (time, event, node, msg))
+
+if __name__ == '__main__':
+    main()
@@ -9,9 +9,13 @@
 '''
 
 import sys
+import os
 import string
 import argparse
 import logging
+import hashlib
+import pickle
+import tempfile
 
 from pprint import pprint
 
@@ -20,6 +24,18 @@ import networkx as nx
 
 # These are GRAPHVIZ attribute names subverted for our own use!
 nodeProps='tooltip'
+edgeProps='tooltip'
+
+# Compiled (parsed, defaulted and validated) graphs are cached here,
+# keyed by hash of the dot file content. Bump cacheVersion whenever
+# loadDataflow() changes what it produces.  Pickles depend on the
+# Python and networkx versions too, so they are part of the key.
+defaultCacheDir = os.path.join(os.path.expanduser('~'), '.cache', 'daflsim')
+cacheVersion = 9
+cacheKey = ('%d:%d.%d:%s:' % (cacheVersion, sys.version_info[0],
+                              sys.version_info[1], nx.__version__)
+            ).encode('utf-8')
+compiledGraphs = dict() # compiledGraphs[digest] = pickled graph
 
 def onpick(event):
     thisline = event.artist
@@ -105,6 +121,8 @@ def loadDataflow(dotfile, outgraphml='foo.graphml'):
     '''\
 "action=" implies "type=a"
 "source=" implies "type=s"
+Edge (tooltip) attributes "bandwidth=" (bytes/sec) and "latency=" (sec)
+describe the network link of an edge between hosts.
     '''
 
     #!G = nx.read_dot(dotfile)
@@ -172,11 +190,117 @@ def loadDataflow(dotfile, outgraphml='foo.graphml'):
         #!d['host'] = dd['host']
         #!d['cron'] = dd['cron']
         d.update(((k,v) for (k,v) in dd.items()
-                  if k in set(['action','host','cron','source'])))
+                  if k in set(['action','host','cron','source','size',
+                               'capacity','policy','key','join',
+                               'probFail','retries','backoff','on_fail',
+                               'trace','count'])))
+        if 'delay' in ud:
+            d['delay'] = ud['delay'] # else the configured default
+
+    for u,v,d in G.edges_iter(data=True):
+        epd = eval('dict(%s)'%(d[edgeProps])) if edgeProps in d else dict()
+        d.update(((k,v) for (k,v) in epd.items()
+                  if k in set(['bandwidth','latency'])))
     
     validateDataflowGraph(G)
+    G.graph['plan'] = wiringPlan(G)
+    return G
+
+def wiringPlan(G):
+    '''\
+Flat, index based description of G for wiring up a simulation.  It is
+computed once per compiled graph (and cached with it), so setting up a
+simulation is a single pass over these lists.
+  nodes[i], types[i]:: node name and type
+  edges[j]:: (index of u, index of v, edge type), e.g. (3, 4, 'qa')
+  inEdges[i], outEdges[i]:: indices into edges, in graph order
+  sinks:: indices of terminals, and of queues nobody reads from
+    '''
+    nodes = list(G.nodes())
+    index = dict((n,i) for (i,n) in enumerate(nodes))
+    types = [G.node[n]['type'] for n in nodes]
+    edges = []
+    edgeIndex = dict()
+    for n in nodes:
+        for v in G.succ[n]:
+            edgeIndex[(n,v)] = len(edges)
+            edges.append((index[n], index[v], types[index[n]] + types[index[v]]))
+    outEdges = [[edgeIndex[(n,v)] for v in G.succ[n]] for n in nodes]
+    inEdges = [[edgeIndex[(u,n)] for u in G.pred[n]] for n in nodes]
+    sinks = [i for i in range(len(nodes))
+             if (types[i] == 't') or (types[i] == 'q' and not outEdges[i])]
+    return dict(nodes=nodes, types=types, edges=edges,
+                inEdges=inEdges, outEdges=outEdges, sinks=sinks)
+
+def loadCompiledDataflow(dotfile, cachedir=defaultCacheDir):
+    '''\
+Like loadDataflow() but skip dot parsing when this dot file content has
+been loaded before (in this process, or in any process if CACHEDIR is
+given). Returns a fresh graph on every call.  Trace files of sources are
+found relative to the directory of DOTFILE (see resolveTraces()).
+
+DOTFILE:: file name or open (seekable) file
+    '''
+    if hasattr(dotfile, 'read'):
+        content = dotfile.read()
+        dotfile.seek(0)
+    else:
+        with open(dotfile, 'rb') as f:
+            content = f.read()
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    digest = hashlib.sha1(cacheKey + content).hexdigest()
+
+    if digest in compiledGraphs:
+        return resolveTraces(pickle.loads(compiledGraphs[digest]), dotfile)
+
+    cachefile = (None if cachedir == None
+                 else os.path.join(cachedir, digest + '.pickle'))
+    if cachefile and os.path.exists(cachefile):
+        with open(cachefile, 'rb') as f:
+            data = f.read()
+        try:
+            G = pickle.loads(data)
+            logging.debug('Loaded compiled dataflow graph from %s' % cachefile)
+            compiledGraphs[digest] = data
+            return resolveTraces(G, dotfile)
+        except (pickle.UnpicklingError, EOFError, AttributeError,
+                ImportError) as err:
+            logging.warning('Ignoring unreadable graph cache %s (%s: %s)'
+                            % (cachefile, type(err).__name__, err))
+    G = loadDataflow(dotfile)
+    data = pickle.dumps(G, pickle.HIGHEST_PROTOCOL)
+    if cachefile:
+        writeCacheFile(cachefile, data)
+    compiledGraphs[digest] = data
+    return resolveTraces(pickle.loads(data), dotfile)
+
+def resolveTraces(G, dotfile):
+    '''Make the trace file names of sources (attribute "trace"), which are
+relative to the dot file, usable from the current directory. The cached
+graph keeps them as written, since the same content may be loaded from
+elsewhere.'''
+    dotname = getattr(dotfile, 'name', dotfile)
+    dotdir = os.path.dirname(dotname) if isinstance(dotname, str) else ''
+    for n, d in G.nodes_iter(data=True):
+        if 'trace' in d:
+            d['trace'] = os.path.join(dotdir, d['trace'])
     return G
 
+def writeCacheFile(cachefile, data):
+    'Write atomically so concurrent workers never see partial files.'
+    cachedir = os.path.dirname(cachefile)
+    try:
+        os.makedirs(cachedir, exist_ok=True)
+        fd, tmpname = tempfile.mkstemp(dir=cachedir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmpname, cachefile)
+        logging.debug('Wrote compiled dataflow graph to %s' % cachefile)
+    except OSError as err:
+        logging.warning('Could not write graph cache %s: %s'
+                        % (cachefile, err))
+
 def drawDataflow(dotfile, outgraphml):
     G = loadDataflow(dotfile, outgraphml)
     fig = drawDfGraph(G)
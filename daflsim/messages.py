@@ -0,0 +1,203 @@
+'''\
+Data records (messages) flowing through the simulation, and tracing of
+their latency.
+'''
+
+from array import array
+from collections import defaultdict, deque
+
+import numpy as np
+
+
+class Message():
+    '''One data record, e.g. an image file. HOPS holds (node, time) of
+every action that handled it. SIZE is in bytes. KEY identifies the
+exposure (or other unit) the record belongs to; all-of joins match on it.
+
+A composite message (several messages taken together by an action) has
+no NAME of its own, just references to its PARTS.  Its name is only
+rendered on demand, so messages do not grow as they are joined again
+and again on their way through the graph.'''
+    __slots__ = ('name', 'created', 'hops', 'parts', 'size', 'key')
+
+    def __init__(self, name, created, hops=None, parts=None, size=0,
+                 key=None):
+        self.name = name
+        self.created = created
+        self.hops = hops if hops != None else []
+        self.parts = parts
+        self.size = size
+        self.key = key
+
+    def __str__(self):
+        if self.parts == None:
+            return self.name
+        return ','.join(self.leafNames())
+
+    def leafNames(self):
+        'Names of all (non composite) messages in this one, in order.'
+        names = []
+        stack = [self]
+        while stack:
+            msg = stack.pop()
+            if msg.parts == None:
+                names.append(msg.name)
+            else:
+                stack.extend(reversed(msg.parts))
+        return names
+
+    def __repr__(self):
+        if self.parts == None:
+            return 'Message(%s, created=%s)' % (self.name, self.created)
+        return 'Message(<%d parts>, created=%s)' % (len(self.parts),
+                                                   self.created)
+
+    def lastTime(self):
+        'Time of last hop (or creation)'
+        return self.hops[-1][1] if self.hops else self.created
+
+    def hop(self, nid, now):
+        'Record that NID handled this message at NOW. Returns stage latency.'
+        latency = now - self.lastTime()
+        self.hops.append((nid, now))
+        return latency
+
+    def fork(self):
+        'Copy, so branches downstream of a fan-out trace separately.'
+        return Message(self.name, self.created, list(self.hops), self.parts,
+                       self.size, self.key)
+
+
+def join(msgList):
+    '''Combine messages taken together by an action into a composite. The
+result is as old as the oldest part and carries its hops and key. Its
+size is the total of the parts.  None if there are no messages (an
+action without inputs).'''
+    if not msgList:
+        return None
+    if len(msgList) == 1:
+        return msgList[0]
+    oldest = min(msgList, key=lambda m: m.created)
+    return Message(None, oldest.created, list(oldest.hops),
+                   tuple(msgList), sum(m.size for m in msgList), oldest.key)
+
+
+class JoinTable():
+    '''Messages waiting for their partners in an all-of join over WIDTH
+inputs, indexed by key, so each arrival costs O(1) (no scanning).'''
+    def __init__(self, width):
+        if width < 1:
+            raise ValueError('Join over %d inputs' % (width,))
+        self.width = width
+        # pending[key] = [missing, [deque of msgs of input]*width]
+        self.pending = dict()
+        self.matched = 0
+
+    def arrive(self, index, msg):
+        '''MSG arrived on input INDEX. Returns the list of parts (one per
+input, in input order) if this completes a match, else None.'''
+        entry = self.pending.get(msg.key)
+        if entry is None:
+            entry = [self.width, [deque() for i in range(self.width)]]
+            self.pending[msg.key] = entry
+        slots = entry[1]
+        if not slots[index]:
+            entry[0] -= 1
+        slots[index].append(msg)
+        if entry[0] > 0:
+            return None
+
+        parts = [slot.popleft() for slot in slots]
+        entry[0] = sum(1 for slot in slots if not slot)
+        if entry[0] == self.width:
+            del self.pending[msg.key]
+        self.matched += 1
+        return parts
+
+    def remove(self, index, msg):
+        '''MSG of input INDEX went away (dropped, or taken by another
+reader).  Returns False if it was not waiting here.'''
+        entry = self.pending.get(msg.key)
+        if entry is None:
+            return False
+        slot = entry[1][index]
+        for i, waiting in enumerate(slot):
+            if waiting is msg:
+                del slot[i]
+                break
+        else:
+            return False
+        if not slot:
+            entry[0] += 1
+            if entry[0] == self.width:
+                del self.pending[msg.key]
+        return True
+
+    def waiting(self):
+        'Number of messages still waiting for partners.'
+        return sum(len(slot) for entry in self.pending.values()
+                   for slot in entry[1])
+
+
+class LatencyTracker():
+    '''Collect per stage (action node) and end-to-end (source to terminal)
+latencies.'''
+    percentiles = (50, 90, 99)
+
+    def __init__(self):
+        self.stages = defaultdict(lambda: array('d')) # stages[nid]
+        self.endToEnd = array('d')
+
+    def stage(self, nid, latency):
+        self.stages[nid].append(latency)
+
+    def arrived(self, dataq):
+        'Dataq observer for terminal queues.'
+        if dataq.items:
+            msg = dataq.items[-1]
+            self.endToEnd.append(dataq.env.now - msg.created)
+
+    def summary(self, values):
+        arr = np.frombuffer(values, dtype=float)
+        if len(arr) == 0:
+            return None
+        res = dict(count=len(arr), mean=arr.mean(), max=arr.max())
+        for p, v in zip(self.percentiles,
+                        np.percentile(arr, self.percentiles)):
+            res['p%d' % p] = v
+        return res
+
+    def report(self, file=None, bins=10):
+        print('End-to-end latency:', file=file)
+        e2e = self.summary(self.endToEnd)
+        if e2e == None:
+            print('  <<no messages reached a terminal>>', file=file)
+        else:
+            print('  count=%d mean=%.1f %s max=%.1f'
+                  % (e2e['count'], e2e['mean'],
+                     ' '.join('p%d=%.1f' % (p, e2e['p%d' % p])
+                              for p in self.percentiles),
+                     e2e['max']),
+                  file=file)
+            counts, edges = np.histogram(
+                np.frombuffer(self.endToEnd, dtype=float), bins=bins)
+            scale = 50.0 / max(counts.max(), 1)
+            for i, cnt in enumerate(counts):
+                print('  [%9.1f, %9.1f) %6d %s'
+                      % (edges[i], edges[i+1], cnt, '#'*int(cnt*scale)),
+                      file=file)
+
+        print('Per-stage latency (seconds since previous stage):', file=file)
+        print('  %15s %6s %8s %s %8s'
+              % ('Stage', 'Count', 'Mean',
+                 ' '.join('%8s' % ('P%d' % p) for p in self.percentiles),
+                 'Max'),
+              file=file)
+        for nid in sorted(self.stages.keys()):
+            s = self.summary(self.stages[nid])
+            print('  %15s %6d %8.1f %s %8.1f'
+                  % (nid, s['count'], s['mean'],
+                     ' '.join('%8.1f' % s['p%d' % p]
+                              for p in self.percentiles),
+                     s['max']),
+                  file=file)
@@ -0,0 +1,74 @@
+'''\
+Columnar recording of queue metrics.
+
+Queue depth is recorded when it changes (on put/get), not by polling.
+File layout is a stream of NumPy (.npy) arrays:
+  names                  (1D unicode array, one name per queue)
+  times, queues, values  (repeated per chunk; queues indexes names)
+Read it back with readMetrics() or "queue_matrix.py metrics.out matrix.csv"
+(use --grid there to downsample to a fixed time grid).
+'''
+
+import numpy as np
+
+
+class MetricsRecorder():
+    '''Buffer changes in preallocated arrays and flush them to OUTFILE
+(binary) one chunk at a time.'''
+    def __init__(self, outfile, names, chunk=4096):
+        self.file = outfile
+        self.names = list(names)
+        self.chunk = chunk
+        self.times = np.empty(chunk, dtype=np.float64)
+        self.queues = np.empty(chunk, dtype=np.int32)
+        self.values = np.empty(chunk, dtype=np.int32)
+        self.count = 0
+        np.save(self.file, np.array(self.names, dtype=str))
+
+    def record(self, timestamp, index, value):
+        'Queue names[INDEX] has VALUE as of TIMESTAMP.'
+        i = self.count
+        self.times[i] = timestamp
+        self.queues[i] = index
+        self.values[i] = value
+        self.count = i + 1
+        if self.count == self.chunk:
+            self.flush()
+
+    def observer(self, index):
+        'Return a Dataq observer that records its depth as names[INDEX].'
+        def observe(dataq):
+            self.record(dataq.env.now, index, len(dataq.items))
+        return observe
+
+    def flush(self):
+        if self.count == 0:
+            return
+        np.save(self.file, self.times[:self.count])
+        np.save(self.file, self.queues[:self.count])
+        np.save(self.file, self.values[:self.count])
+        self.count = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def isMetricsFile(infile):
+    'True if binary INFILE starts like a metrics file (peeks, no read).'
+    return infile.peek(6)[:6] == b'\x93NUMPY'
+
+
+def readMetrics(infile):
+    '''Generator. First yields list of names, then (times, queues, values)
+per chunk.'''
+    names = np.load(infile)
+    yield list(names)
+    while True:
+        try:
+            times = np.load(infile)
+        except (EOFError, ValueError):
+            return
+        queues = np.load(infile)
+        values = np.load(infile)
+        yield times, queues, values
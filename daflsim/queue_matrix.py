@@ -10,57 +10,264 @@
 '''
 
 import sys
+import io
 import string
 import argparse
 import logging
-import csv
+import tempfile
 from pprint import pprint
 
-sample='''
-dataq.dtskp.q1235 0 1
-dataq.dtskp.q1335 0 1
-dataq.dtskp.q1435 0 1
-dataq.dtstuc.q6135 0 1
-'''
+import numpy as np
+
+from daflsim import metrics
+
+# Lines read (and pivoted) at a time. Memory use is bounded by this and
+# the number of distinct paths, not by the size of the input.
+chunkLines = 100000
+
+def lineFormat(line):
+    '''Return (separator, path column, timestamp column, value column) for
+our feed_graphite() output ("path,timestamp,value") or graphite plaintext
+("path value timestamp").'''
+    if ',' in line:
+        return ',', 0, 1, 2
+    return None, 0, 2, 1
+
+def readChunks(infile, size=chunkLines):
+    'Generator of lists of (at most SIZE) non-blank lines.'
+    lines = []
+    for line in infile:
+        if line.strip():
+            lines.append(line)
+            if len(lines) == size:
+                yield lines
+                lines = []
+    if lines:
+        yield lines
+
+def spoolPaths(infile, spool):
+    '''Copy INFILE to SPOOL (if given) while collecting the set of paths.
+Returns (sorted paths, line format, True if timestamps never decrease).'''
+    paths = set()
+    fmt = None
+    ordered = True
+    lastStamp = -np.inf
+    for lines in readChunks(infile):
+        if fmt == None:
+            fmt = lineFormat(lines[0])
+        sep, pcol, tcol = fmt[:3]
+        fields = [line.split(sep) for line in lines]
+        paths.update(f[pcol] for f in fields)
+        if ordered:
+            stamps = np.array([f[tcol] for f in fields], dtype=float)
+            ordered = ((stamps[0] >= lastStamp)
+                       and bool(np.all(np.diff(stamps) >= 0)))
+            lastStamp = stamps[-1]
+        if spool:
+            spool.writelines(lines)
+    return sorted(paths), fmt, ordered
+
+def sortedChunks(infile, fmt, size=chunkLines):
+    '''Like readChunks() but in timestamp order. Reads all of INFILE
+into memory.'''
+    tcol = fmt[2]
+    lines = [line for line in infile if line.strip()]
+    # Stable, so the last value given for a (time,path) still wins
+    lines.sort(key=lambda line: float(line.split(fmt[0])[tcol]))
+    for i in range(0, len(lines), size):
+        yield lines[i:i+size]
+
+def parseChunk(lines, fmt, pathIndex):
+    'Return (timestamps, path indices, values) arrays for LINES.'
+    sep, pcol, tcol, vcol = fmt
+    fields = [line.split(sep) for line in lines]
+    pidx = np.array([pathIndex[f[pcol]] for f in fields])
+    stamps = np.array([f[tcol] for f in fields], dtype=float)
+    vals = np.array([f[vcol] for f in fields], dtype=float)
+    return stamps, pidx, vals
+
+def pivotArrays(stamps, pidx, vals, numPaths):
+    '''Return (times, values) where VALUES is (len(times) x NUMPATHS),
+NaN where a path had no value at that time.'''
+    times, row = np.unique(stamps, return_inverse=True)
+    dense = np.full((len(times), numPaths), np.nan)
+    # Stable order so the last value given for a (time,path) wins
+    order = np.argsort(stamps, kind='stable')
+    dense[row[order], pidx[order]] = vals[order]
+    return times, dense
+
+def forwardFill(values, lastRow):
+    '''Fill NaN cells with the value of the same path in the previous row
+(LASTROW for the first row).'''
+    values = np.vstack((lastRow, values))
+    valid = ~np.isnan(values)
+    idx = np.where(valid, np.arange(len(values))[:, None], 0)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    filled = values[idx, np.arange(values.shape[1])]
+    return filled[1:]
+
+def denseRows(chunks, numPaths):
+    '''Generator. Turn CHUNKS of (timestamps, path indices, values) into
+chunks of (times, rows) with one complete row per distinct time. Input
+must be in (non decreasing) timestamp order. A path without a value at
+some time keeps its previous value.'''
+    lastRow = np.full(numPaths, np.nan)
+    held = None # (time, row) that may continue in the next chunk
+    for stamps, pidx, vals in chunks:
+        if len(stamps) == 0:
+            continue
+        times, values = pivotArrays(stamps, pidx, vals, numPaths)
+        if held is not None:
+            if times[0] < held[0]:
+                raise RuntimeError(
+                    'Input is not in timestamp order at time %s'
+                    % times[0])
+            if times[0] == held[0]:
+                values[0] = np.where(np.isnan(values[0]),
+                                     held[1], values[0])
+            else:
+                times = np.concatenate(([held[0]], times))
+                values = np.vstack((held[1], values))
+        held = (times[-1], values[-1])
+        if len(times) > 1:
+            filled = forwardFill(values[:-1], lastRow)
+            yield times[:-1], filled
+            lastRow = filled[-1]
+    if held is not None:
+        yield (np.array([held[0]]),
+               forwardFill(held[1][None, :], lastRow))
+
+def resampleGrid(chunks, step):
+    '''Generator. Downsample chunks of (times, rows) to the grid
+0, STEP, 2*STEP, ... up to the last time. Each grid time gets the last
+row at or before it.'''
+    k = 0 # next grid index
+    lastTime, lastRow = None, None
+    for times, values in chunks:
+        if lastRow is None:
+            lastRow = np.full(values.shape[1], np.nan)
+        # Grid times before the end of this chunk are final now
+        kEnd = int(np.ceil(times[-1] / step))
+        if kEnd > k:
+            grid = np.arange(k, kEnd) * step
+            idx = np.searchsorted(times, grid, side='right') - 1
+            rows = np.vstack((lastRow, values))[idx + 1]
+            yield grid, rows
+            k = kEnd
+        lastTime, lastRow = times[-1], values[-1]
+    if lastTime is not None:
+        kEnd = int(np.floor(lastTime / step)) + 1
+        if kEnd > k:
+            grid = np.arange(k, kEnd) * step
+            yield grid, np.tile(lastRow, (len(grid), 1))
+
+def writeMatrix(chunks, outcsv, paths, grid=None):
+    writer = MatrixWriter(outcsv, paths)
+    if grid:
+        chunks = resampleGrid(chunks, grid)
+    for times, values in chunks:
+        writer.write(times, values)
+    writer.close()
 
 ## DOXYGEN documentation for a function.
 #
-# More details.
-def toMatrix(incsv,outcsv):
-    matrix = dict() # matrix[timestamp] = dict(path1=value1,path2=value2,...)
-    paths = set()
-    with incsv as csvfile:
-        dialect = csv.Sniffer().sniff(sample,delimiters=' ')
-        reader = csv.DictReader(incsv, dialect=dialect,
-                                fieldnames=['path','value','timestamp'])
-        for d in reader:
-            paths.add(d['path'])
-            matrix.setdefault(int(d['timestamp']),dict())
-            matrix[int(d['timestamp'])][d['path']] = d['value']
-
-    # Delete duplicates (keep both ends of run but remove middle)
-    prev1Value,prev1Key,prev2Value,prev2Key = [None]*4
-    t = sorted(matrix.keys(),reverse=True) # time (seconds)
-    nukem = set()
-    for i in range(2,len(t)):
-        if matrix[t[i]] == matrix[t[i-1]] == matrix[t[i-2]]:
-            nukem.add(t[i-1])
-    for k in nukem:
-        del matrix[k]
-
-    # Print matrix
-    print('time',',',end='', file=outcsv)        
-    for p in sorted(paths):
-        print(p,',',end='', file=outcsv)        
-    print(file=outcsv)
-    for k in sorted(matrix.keys()):
-        print(k,',',end='', file=outcsv)
-        for p in sorted(paths):
-            print(matrix[k][p],',',end='', file=outcsv)
-        print(file=outcsv)
+# Streaming: reads CHUNKLINES at a time. The log should be in (non
+# decreasing) timestamp order, as written by daflsim; if it is not, it
+# is sorted in memory instead (with a warning). A path without a value
+# at some time keeps its previous value. If GRID is given, output one
+# row every GRID seconds instead of one per distinct timestamp.
+def toMatrix(incsv, outcsv, grid=None):
+    with incsv:
+        if incsv.seekable():
+            spool = None
+            paths, fmt, ordered = spoolPaths(incsv, None)
+            incsv.seek(0)
+            source = incsv
+        else:
+            spool = tempfile.TemporaryFile(mode='w+')
+            paths, fmt, ordered = spoolPaths(incsv, spool)
+            spool.seek(0)
+            source = spool
+        pathIndex = dict((p, i) for (i, p) in enumerate(paths))
+        if ordered:
+            lineChunks = readChunks(source)
+        else:
+            logging.warning('Input is not in timestamp order;'
+                            ' sorting it in memory')
+            lineChunks = sortedChunks(source, fmt)
+        chunks = (parseChunk(lines, fmt, pathIndex) for lines in lineChunks)
+        writeMatrix(denseRows(chunks, len(paths)), outcsv, paths, grid=grid)
+        if spool:
+            spool.close()
+
+
+def rowsEqual(a, b):
+    'Elementwise equality where NaN (no value yet) equals NaN.'
+    eq = (a == b)
+    if eq.dtype == bool and np.asarray(a).dtype.kind == 'f':
+        eq |= np.isnan(a) & np.isnan(b)
+    return eq
+
+class MatrixWriter():
+    '''\
+Write rows of a (time x path) matrix to OUTCSV in the same format as
+toMatrix(). Rows are given in chunks; runs of identical rows are
+collapsed to both ends of the run, across chunk boundaries.
+    '''
+    def __init__(self, outcsv, paths):
+        self.file = outcsv
+        self.prev = None # row before the held row
+        self.held = None # (time, row) awaiting the next row
+        print('time ,' + ''.join('%s ,' % p for p in paths), file=outcsv)
 
+    def write(self, times, values):
+        'VALUES has shape (len(times), len(paths)).'
+        if len(times) == 0:
+            return
+        times = np.asarray(times)
+        values = np.asarray(values)
+        prev = self.prev
+        if self.held is not None:
+            times = np.concatenate(([self.held[0]], times))
+            values = np.vstack((self.held[1], values))
 
+        # same[i]:: row i+1 equals row i
+        same = np.all(rowsEqual(values[1:], values[:-1]), axis=1)
+        keep = np.ones(len(times), dtype=bool)
+        keep[1:-1] = ~(same[:-1] & same[1:])
+        if (prev is not None) and (len(times) > 1):
+            keep[0] = not (same[0] and np.all(rowsEqual(values[0], prev)))
 
+        # The last row is held back until we know what follows it
+        self.emit(times[:-1][keep[:-1]], values[:-1][keep[:-1]])
+        if len(times) > 1:
+            self.prev = values[-2]
+        self.held = (times[-1], values[-1])
+
+    def emit(self, times, values):
+        if len(times) == 0:
+            return
+        np.savetxt(self.file, np.column_stack((times, values)),
+                   fmt=['%d'] + ['%.15g'] * values.shape[1],
+                   delimiter=' ,', newline=' ,\n')
+
+    def close(self):
+        if self.held is not None:
+            self.emit(np.array([self.held[0]]), np.array([self.held[1]]))
+            self.held = None
+
+
+def metricsToMatrix(infile, outcsv, grid=None):
+    'Like toMatrix() but for (binary) output of metrics.MetricsRecorder'
+    chunks = metrics.readMetrics(infile)
+    names = next(chunks)
+    order = np.argsort(names)
+    rank = np.empty(len(names), dtype=int)
+    rank[order] = np.arange(len(names))
+    changes = ((times, rank[queues], values)
+               for (times, queues, values) in chunks)
+    writeMatrix(denseRows(changes, len(names)), outcsv,
+                [names[i] for i in order], grid=grid)
 
 
 ##############################################################################
@@ -71,12 +278,17 @@ def main():
         epilog='EXAMPLE: %(prog)s a b"'
         )
     parser.add_argument('--version', action='version',  version='1.0.1')
-    parser.add_argument('infile', type=argparse.FileType('r'),
-                        help='Input file')
+    parser.add_argument('infile', type=argparse.FileType('rb'),
+                        help='Input file (graphite text, or --metrics output'
+                        ' of daflsim)')
     parser.add_argument('outfile', type=argparse.FileType('w'),
                         help='Output output'
                         )
 
+    parser.add_argument('--grid', type=float,
+                        help='Output one row every GRID seconds'
+                        ' [default: one row per change]')
+
     parser.add_argument('--loglevel',      help='Kind of diagnostic output',
                         choices=['CRTICAL', 'ERROR', 'WARNING',
                                  'INFO', 'DEBUG'],
@@ -100,7 +312,11 @@ def main():
                         )
     logging.debug('Debug output is enabled in %s !!!', sys.argv[0])
 
-    toMatrix(args.infile, args.outfile)
+    with args.outfile as outfile:
+        if metrics.isMetricsFile(args.infile):
+            metricsToMatrix(args.infile, outfile, grid=args.grid)
+        else:
+            toMatrix(io.TextIOWrapper(args.infile), outfile, grid=args.grid)
 
 if __name__ == '__main__':
     main()
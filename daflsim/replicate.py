@@ -0,0 +1,85 @@
+'''\
+Run many independently seeded simulations and merge their statistics.
+'''
+
+import multiprocessing
+from collections import defaultdict
+
+import numpy as np
+
+# Percentiles reported for every merged metric
+percentiles = (5, 50, 95)
+
+
+def runJobs(func, jobs, workers=None):
+    '''Apply FUNC to every element of JOBS across a pool of WORKERS
+processes (default: one per CPU).  Results are returned in job order.'''
+    if workers == 1 or len(jobs) < 2:
+        return [func(job) for job in jobs]
+    with multiprocessing.Pool(workers) as pool:
+        return pool.map(func, jobs, chunksize=1)
+
+
+def mergeQueueStats(results, section='queues'):
+    '''\
+RESULTS:: list of dicts as returned by daflsim.collectStats()
+SECTION:: 'queues' or 'hosts'
+Returns: merged[qname][metric] = dict(mean=, std=, min=, max=, p5=, ...)
+    '''
+    samples = defaultdict(lambda: defaultdict(list))
+    for res in results:
+        for qname, qstats in res[section].items():
+            for metric, value in qstats.items():
+                samples[qname][metric].append(value)
+
+    merged = dict()
+    for qname, metrics in samples.items():
+        merged[qname] = dict()
+        for metric, values in metrics.items():
+            arr = np.asarray(values, dtype=float)
+            summary = dict(mean=arr.mean(), std=arr.std(),
+                           min=arr.min(), max=arr.max())
+            for p, v in zip(percentiles, np.percentile(arr, percentiles)):
+                summary['p%d' % p] = v
+            merged[qname][metric] = summary
+    return merged
+
+
+def printReplicationHeader(results, file=None):
+    'Once, before the summaries (printReplicationSummary) of RESULTS.'
+    print('#'*55, file=file)
+    print('Replications: %d  (seeds: %s)'
+          % (len(results), ','.join(str(r['seed']) for r in results)),
+          file=file)
+
+
+def printReplicationSummary(merged, file=None, title='Queue'):
+    'Per TITLE (queue, host, ...) and statistic rows of MERGED.'
+    pcols = ['P%d' % p for p in percentiles]
+    print('  %15s %10s %8s %8s %s'
+          % (title, 'Metric', 'Mean', 'Std',
+             ' '.join('%8s' % c for c in pcols)),
+          file=file)
+    for qname in sorted(merged.keys()):
+        for metric in sorted(merged[qname].keys()):
+            s = merged[qname][metric]
+            print('  %15s %10s %8.2f %8.2f %s'
+                  % (qname, metric, s['mean'], s['std'],
+                     ' '.join('%8.2f' % s['p%d' % p] for p in percentiles)),
+                  file=file)
+
+
+def printSteadySummary(results, file=None):
+    '''Merged steady state estimates (after each run's warm-up) of
+RESULTS from runs --until-steady.'''
+    converged = sum(1 for r in results if r['converged'])
+    print('#'*55, file=file)
+    print('Steady state: %d of %d replications converged; warm-up mean %.0f,'
+          ' max %.0f seconds'
+          % (converged, len(results),
+             np.mean([r['warmup'] for r in results]),
+             max(r['warmup'] for r in results)),
+          file=file)
+    merged = mergeQueueStats(results, section='steady')
+    if len(merged) > 0:
+        printReplicationSummary(merged, file=file, title='Steady')
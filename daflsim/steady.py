@@ -0,0 +1,164 @@
+'''\
+Run a simulation only until its queue statistics reach steady state.
+
+The run advances BATCH simulated seconds at a time.  After every batch
+the time averaged depth of each queue (except sinks, whose depth only
+grows), and the throughput (gets per second; puts per second for sinks),
+are recorded.  The warm-up is the longest MSER truncation point over those
+series.  The batches after it are grouped into batchCount batch means.
+Every metric's confidence interval must be within PRECISION (relative)
+of its mean.  Queues must be profiled (Dataq STATS kept).
+'''
+
+import logging
+
+import numpy as np
+
+# Batch means in the confidence interval, and Student t quantile for them
+# (two sided 95%, batchCount-1 degrees of freedom)
+batchCount = 20
+tQuantile = 2.093
+
+
+def mserTruncation(x):
+    '''Warm-up length (number of leading observations to delete) of series X
+minimizing the MSER statistic; only the first half is considered.'''
+    n = len(x)
+    tail = x[::-1]
+    count = np.arange(1, n + 1)
+    sums = np.cumsum(tail)
+    sumsq = np.cumsum(tail * tail)
+    # For d deleted: n-d observations remain
+    sse = sumsq - sums * sums / count
+    mser = (sse / (count * count))[::-1]
+    return int(np.argmin(mser[:n//2 + 1]))
+
+
+def batchMeans(x, batches=batchCount):
+    '''Mean and confidence half width of X by (non overlapping) batch means.
+Leading observations that do not fill a batch are dropped.'''
+    size = len(x) // batches
+    means = x[len(x) - size*batches:].reshape(batches, size).mean(axis=1)
+    return means.mean(), tQuantile * means.std(ddof=1) / np.sqrt(batches)
+
+
+class SteadyState():
+    '''Per batch observations of the queues of graph G.'''
+    def __init__(self, G, precision=0.05, minBatches=2*batchCount):
+        plan = G.graph['plan']
+        sinks = set(plan['sinks'])
+        self.queues = [(G.node[n]['sim'], i in sinks)
+                       for (i, n) in enumerate(plan['nodes'])
+                       if plan['types'][i] in ('q', 't')]
+        self.inner = np.array([not sink for (q, sink) in self.queues])
+        self.names = ([q.name + ':depth' for (q, sink) in self.queues
+                       if not sink]
+                      + [q.name + ':rate' for (q, sink) in self.queues])
+        self.precision = precision
+        self.minBatches = max(minBatches, batchCount)
+        self.rows = []
+        self.lastTime = None
+        self.lastArea = None
+        self.lastCount = None
+        self.warmup = 0     # batches
+        self.times = []
+        self.isConverged = False
+        self.estimates = None
+
+    def sample(self, now):
+        area = np.array([q.stats.area
+                         + q.stats.lastDepth * (now - q.stats.lastTime)
+                         for (q, sink) in self.queues])
+        count = np.array([q.stats.puts if sink else q.stats.gets
+                          for (q, sink) in self.queues], dtype=float)
+        return area, count
+
+    def start(self, now):
+        self.lastTime = now
+        self.lastArea, self.lastCount = self.sample(now)
+
+    def observe(self, now):
+        'Record the batch ending at NOW.'
+        area, count = self.sample(now)
+        span = now - self.lastTime
+        depth = (area - self.lastArea)[self.inner] / span
+        self.rows.append(np.concatenate((depth,
+                                         (count - self.lastCount) / span)))
+        self.times.append(now)
+        self.lastTime, self.lastArea, self.lastCount = now, area, count
+
+    def converged(self):
+        'Estimate from batches so far.  True if all are precise enough.'
+        if len(self.rows) < self.minBatches:
+            return False
+        X = np.array(self.rows)
+        self.warmup = max(mserTruncation(X[:, j]) for j in range(X.shape[1]))
+        X = X[self.warmup:]
+        if len(X) < batchCount:
+            self.estimates = None
+            return False
+        self.estimates = [batchMeans(X[:, j]) for j in range(X.shape[1])]
+        self.isConverged = all(half <= self.precision * abs(mean)
+                               for (mean, half) in self.estimates)
+        return self.isConverged
+
+    def warmupTime(self):
+        return self.times[self.warmup - 1] if self.warmup > 0 else 0
+
+    def collectStats(self):
+        '''Estimates after the warm-up as plain data (for simulate()):
+dict(converged=, warmup=, steady_throughput=, steady_throughput_ci=,
+steady=[qname][depth, depth_ci, rate_hr, rate_hr_ci]).  Throughput is
+messages/second into the sinks; estimates are empty (None) if there
+were too few batches.'''
+        stats = dict(converged=self.isConverged, warmup=self.warmupTime(),
+                     steady_throughput=None, steady_throughput_ci=None,
+                     steady=dict())
+        if self.estimates is None:
+            return stats
+        hours = 60*60
+        nInner = np.count_nonzero(self.inner)
+        depths = iter(self.estimates[:nInner])
+        rates = iter(self.estimates[nInner:])
+        for (q, sink) in self.queues:
+            est = stats['steady'][q.name] = dict()
+            if not sink:
+                mean, half = next(depths)
+                est.update(depth=mean, depth_ci=half)
+            mean, half = next(rates)
+            est.update(rate_hr=mean * hours, rate_hr_ci=half * hours)
+        X = np.array(self.rows[self.warmup:])[:, nInner:]
+        sinkRates = X[:, ~self.inner].sum(axis=1)
+        (stats['steady_throughput'],
+         stats['steady_throughput_ci']) = batchMeans(sinkRates)
+        return stats
+
+    def printReport(self, file=None):
+        print('#'*55, file=file)
+        print('Steady state estimates (warm-up until %s, %d of %d batches'
+              ' used):' % (self.warmupTime(), len(self.rows) - self.warmup,
+                           len(self.rows)),
+              file=file)
+        if self.estimates is None:
+            print('  Too few batches for estimates', file=file)
+            return
+        print('  %25s %10s %10s' % ('Metric', 'Mean', '+/-95%'), file=file)
+        for name, (mean, half) in zip(self.names, self.estimates):
+            print('  %25s %10.4f %10.4f' % (name, mean, half), file=file)
+
+
+def runUntilSteady(env, G, end, batch=600, precision=0.05):
+    '''Run ENV in BATCH second steps until steady state is detected, or END.
+Returns the SteadyState (converged or not).'''
+    steady = SteadyState(G, precision=precision)
+    steady.start(env.now)
+    while env.now < end:
+        env.run(until=min(env.now + batch, end))
+        steady.observe(env.now)
+        if steady.converged():
+            logging.info('Steady state at %s (warm-up %s)',
+                         env.now, steady.warmupTime())
+            return steady
+    logging.warning('Steady state not reached to %s precision by %s',
+                    precision, end)
+    return steady
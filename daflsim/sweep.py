@@ -0,0 +1,121 @@
+'''\
+Parameter sweeps over the simulation configuration (see defaultCfg).
+
+A sweep spec looks like one of:
+  action_delay=5,10,20        (explicit list)
+  action_delay=5:60:5         (start:stop:step, stop inclusive)
+'''
+
+import csv
+import itertools
+from math import isclose
+
+
+def parseValue(text):
+    for typ in (int, float):
+        try:
+            return typ(text)
+        except ValueError:
+            pass
+    return text
+
+
+def decimals(text):
+    'Number of digits after the decimal point in number TEXT.'
+    text = text.strip().lower()
+    if 'e' in text or '.' not in text:
+        return 0
+    return len(text.split('.')[1])
+
+
+def parseSweepSpec(spec):
+    'Return (name, [value, ...]) from one sweep SPEC string.'
+    if '=' not in spec:
+        raise ValueError('Sweep spec must look like "name=values": "%s"'
+                         % (spec,))
+    name, values = spec.split('=', 1)
+    name = name.strip()
+    if ':' in values:
+        parts = [parseValue(v) for v in values.split(':')]
+        if len(parts) == 2:
+            parts.append(1)
+        if len(parts) != 3 or parts[2] <= 0:
+            raise ValueError('Bad range "%s" in sweep spec "%s"'
+                             % (values, spec))
+        start, stop, step = parts
+        # Count the steps, rather than adding STEP up, so float error
+        # can not drop STOP or add a point past it
+        n = int(round((stop - start) / step))
+        if start + n*step > stop and not isclose(start + n*step, stop):
+            n -= 1
+        digits = max(decimals(v) for v in values.split(':'))
+        vals = [start + k*step for k in range(n + 1)]
+        if digits > 0:
+            vals = [round(v, digits) for v in vals]
+    else:
+        vals = [parseValue(v) for v in values.split(',')]
+    return name, vals
+
+
+def expandGrid(specs, baseCfg):
+    '''Return list of (params, cfg) for the cartesian product of all
+sweep SPECS.  PARAMS holds only the swept values, CFG is BASECFG updated
+with them.'''
+    grid = [parseSweepSpec(s) for s in specs]
+    for name, vals in grid:
+        if name not in baseCfg:
+            raise ValueError('Unknown configuration parameter "%s". '
+                             'Expecting one of: %s'
+                             % (name, ', '.join(sorted(baseCfg.keys()))))
+        if isinstance(baseCfg[name], dict):
+            raise ValueError('Can not sweep "%s": its value is a table'
+                             ' (set it with --cfg)' % (name,))
+    names = [name for name, vals in grid]
+    points = []
+    for combo in itertools.product(*[vals for name, vals in grid]):
+        params = dict(zip(names, combo))
+        pcfg = dict(baseCfg)
+        pcfg.update(params)
+        points.append((params, pcfg))
+    return points
+
+
+def resultRow(params, stats):
+    'Flatten one simulation result into a row of the tidy results table.'
+    qstats = [q for (name, q) in stats['queues'].items()
+              if name not in stats['terminals']]
+    row = dict(params)
+    row['seed'] = stats['seed']
+    row['end'] = stats['end']
+    row['delivered'] = stats['delivered']
+    row['throughput'] = stats['delivered'] / stats['end']
+    row['max_queue_depth'] = max([q['hiwater'] for q in qstats] or [0])
+    row['backlog'] = sum(q['backlog'] for q in qstats)
+    row['drops'] = sum(q['drops'] for q in qstats)
+    row['blocked'] = sum(stats['blocked'].values())
+    row['failures'] = sum(f['failures'] for f in stats['failures'].values())
+    row['wasted'] = sum(f['wasted'] for f in stats['failures'].values())
+    if 'steady' in stats:
+        # Estimates after the warm-up (run --until-steady)
+        row['converged'] = int(stats['converged'])
+        row['warmup'] = stats['warmup']
+        row['steady_throughput'] = stats['steady_throughput']
+        row['steady_throughput_ci'] = stats['steady_throughput_ci']
+        row['steady_max_depth'] = max(
+            [q['depth'] for (name, q) in stats['steady'].items()
+             if name not in stats['terminals']] or [None])
+    return row
+
+
+def writeTable(rows, outfile, paramNames, steady=False):
+    fields = (list(paramNames)
+              + ['seed', 'end', 'delivered', 'throughput',
+                 'max_queue_depth', 'backlog', 'drops', 'blocked',
+                 'failures', 'wasted'])
+    if steady:
+        fields += ['converged', 'warmup', 'steady_throughput',
+                   'steady_throughput_ci', 'steady_max_depth']
+    writer = csv.DictWriter(outfile, fieldnames=fields)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
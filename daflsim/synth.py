@@ -0,0 +1,94 @@
+#! /usr/bin/env python3
+'''\
+Generate synthetic DCI-like dataflow graphs (graphviz dot) of any size.
+
+Every site has an instrument feeding stb -> client -> bundle through
+three queues on its own host.  Bundles cross to one of the archive
+hosts, are unbundled into the host's ingest queue, then submitted to the
+archive (NSA).  Failed submits go through a resubmit loop.  Cron
+schedules are picked at random (reproducibly) from typical ones.
+'''
+
+import sys
+import argparse
+import random
+
+# Cron schedules of site (client, bundle) and archive actions
+siteCrons = ['* *', '*/5', '*/10 *', '35 *', '0 *']
+archiveCrons = ['*/2 *', '*/5', '*/10 *']
+
+
+def synthDataflow(sites, archives=1, count=5, seed=0, outfile=sys.stdout):
+    '''Write dot for SITES sites feeding ARCHIVES archive hosts to OUTFILE.
+Each instrument emits COUNT records.
+Nodes: 8*SITES + 6*ARCHIVES + 1, queues: 3*SITES + 3*ARCHIVES + 1.'''
+    rand = random.Random(seed)
+    def out(line):
+        print(line, file=outfile)
+
+    out('digraph synth {')
+    out('    NSA [tooltip="type=\'q\',host=\'archive\'"];')
+    for a in range(archives):
+        host = 'arch%03d' % a
+        out('    ingest%d [tooltip="host=\'%s\',type=\'q\'"];' % (a, host))
+        out('    staged%d [tooltip="host=\'%s\',type=\'q\'"];' % (a, host))
+        out('    failed%d [tooltip="host=\'%s\',type=\'q\'"];' % (a, host))
+        out('    aclient%d [tooltip="host=\'%s\',action=\'client\','
+            'cron=\'%s\'"];' % (a, host, rand.choice(archiveCrons)))
+        out('    submit%d [tooltip="host=\'%s\',action=\'submit_to_archive\','
+            'on_fail=\'failed%d\',cron=\'%s\'"];'
+            % (a, host, a, rand.choice(archiveCrons)))
+        out('    resubmit%d [tooltip="host=\'%s\',action=\'resubmit\','
+            'cron=\'%s\'"];' % (a, host, rand.choice(archiveCrons)))
+        out('    ingest%d -> aclient%d -> staged%d -> submit%d -> NSA;'
+            % (a, a, a, a))
+        out('    submit%d -> failed%d -> resubmit%d -> staged%d;'
+            % (a, a, a, a))
+
+    for s in range(sites):
+        host = 'site%04d' % s
+        a = s % archives
+        out('    inst%d [tooltip="host=\'%s\',source=\'I%d\',count=%d"];'
+            % (s, host, s, count))
+        out('    stb%d [tooltip="host=\'%s\',action=\'stb\'"];' % (s, host))
+        for q in ('qa', 'qb', 'qc'):
+            out('    %s%d [tooltip="host=\'%s\',type=\'q\'"];' % (q, s, host))
+        out('    client%d [tooltip="host=\'%s\',action=\'client\','
+            'cron=\'%s\'"];' % (s, host, rand.choice(siteCrons)))
+        out('    bundle%d [tooltip="host=\'%s\',action=\'bundle\','
+            'cron=\'%s\'"];' % (s, host, rand.choice(siteCrons)))
+        out('    unbundle%d [tooltip="host=\'arch%03d\',action=\'unbundle\','
+            'cron=\'%s\'"];' % (s, a, rand.choice(archiveCrons)))
+        out('    inst%d -> stb%d -> qa%d -> client%d -> qb%d -> bundle%d'
+            ' -> qc%d -> unbundle%d -> ingest%d;'
+            % (s, s, s, s, s, s, s, s, a))
+    out('}')
+
+
+##############################################################################
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate a synthetic DCI-like dataflow graph',
+        epilog='EXAMPLE: %(prog)s --sites 1000 --archives 4 big.dot'
+        )
+    parser.add_argument('outfile', type=argparse.FileType('w'),
+                        help='Graphviz (dot) file to write')
+    parser.add_argument('--sites', type=int, default=10,
+                        help='Number of instrument sites [default=%(default)s]')
+    parser.add_argument('--archives', type=int, default=1,
+                        help='Number of archive (ingest) hosts'
+                        ' [default=%(default)s]')
+    parser.add_argument('--count', type=int, default=5,
+                        help='Records emitted per instrument'
+                        ' [default=%(default)s]')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed for picking cron schedules')
+    args = parser.parse_args()
+
+    synthDataflow(args.sites, archives=args.archives, count=args.count,
+                  seed=args.seed, outfile=args.outfile)
+    args.outfile.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+'''\
+Observation logs (traces) that drive sources.
+
+A source with a "trace=" attribute replays its trace instead of
+generating records at a fixed interval.  One record per line:
+  timestamp filename [size]
+TIMESTAMP is seconds (e.g. Unix epoch) or ISO 8601 ("2016-03-01T02:13:05").
+Times are relative to the first record.  SIZE is bytes.  Blank lines and
+lines starting with "#" are ignored.  Files ending in ".gz" are
+decompressed on the fly.  Traces are read lazily, one line at a time.
+'''
+
+import datetime
+import gzip
+import os
+
+
+def parseTimestamp(text):
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.datetime.fromisoformat(text).timestamp()
+
+
+def openTrace(filename):
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'rt')
+    return open(filename)
+
+
+def readTrace(filename):
+    '''Generator of (time, name, size) per record of trace FILENAME. TIME
+is seconds since the first record; SIZE is None if not given.'''
+    start = None
+    last = None
+    with openTrace(filename) as trace:
+        for lineno, line in enumerate(trace, 1):
+            fields = line.split()
+            if len(fields) == 0 or fields[0].startswith('#'):
+                continue
+            if len(fields) not in (2, 3):
+                raise ValueError('%s:%d: expected "timestamp filename [size]",'
+                                 ' got: %s' % (filename, lineno, line.strip()))
+            timestamp = parseTimestamp(fields[0])
+            if start == None:
+                start = timestamp
+            elif timestamp < last:
+                raise ValueError('%s:%d: records out of time order'
+                                 % (filename, lineno))
+            last = timestamp
+            size = float(fields[2]) if len(fields) == 3 else None
+            yield timestamp - start, fields[1], size
+
+
+def recordKey(name):
+    '''Key of record NAME for all-of joins: the base name without
+extensions, so "c4d_160301_021305_ori.hdr" and ".fits.fz" match.'''
+    return os.path.basename(name).split('.')[0]
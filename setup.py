@@ -69,6 +69,7 @@ setup(
     install_requires=[
         'graphviz',
         'networkx',
+        'numpy',
         'simpy>=3',
     ],
     
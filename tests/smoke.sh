@@ -45,6 +45,122 @@ testCommand dim1_1 "daflsim --end 10000 --summarize NSA --profile $dcidot 2>&1"
 # Order varies
 #!testOutput out $fg1 '^\#' n
 
+########################################
+## Checkpoint and resume: the resumed run must match the uninterrupted
+## one (resume_1.out.GOLD is a copy of resume_0.out.GOLD)
+##
+testCommand resume_0 "daflsim --end 20000 --summarize NSA --profile --checkpoint-at 6000 --checkpoint resume $dcidot" "^\#" n
+testCommand resume_1 "daflsim --end 20000 --summarize NSA --profile --resume resume.6000.ckpt $dcidot" "^\#" n
+rm -f resume.6000.ckpt
+
+########################################
+## Queue depth recording.  The GOLD file was made with the old dict-based
+## queue_matrix.toMatrix on qmatrix.log, a random log.  The same log in
+## reverse time order (from a pipe) is sorted, with a warning, so
+## qmatrix_1.out.GOLD is a copy of qmatrix_0.out.GOLD
+##
+testCommand qmatrix_0 "python -m daflsim.queue_matrix qmatrix.log -" "^\#" n
+testCommand qmatrix_1 "sort -s -k3,3nr qmatrix.log | python -m daflsim.queue_matrix - -" "^\#" n
+
+########################################
+## Replications
+##
+testCommand repl_0 "daflsim --end 10000 --replications 3 --workers 1 --cfg retry.cfg failing.dot" "^\#" n
+
+########################################
+## Parameter sweeps
+##
+testCommand sweep_0 "daflsim --end 10000 --sweep action_delay=5,30 --sweep retries=0:2 --workers 1 failing.dot" "^\#" n
+
+########################################
+## Compiled graph cache: an unreadable (truncated) cache file is reparsed
+## and rewritten, so the last run loads it without a warning
+##
+gcache="--end 10000 --summarize NSA --graph-cache gcache $dcidot"
+testCommand cache_0 "rm -rf gcache; daflsim $gcache > /dev/null; for f in gcache/*.pickle; do head -c 100 \$f > \$f.tmp; mv \$f.tmp \$f; done; daflsim $gcache 2>&1 | sed 's/[0-9a-f]*\.pickle/DIGEST.pickle/'; daflsim $gcache" "^\#" n
+rm -rf gcache
+
+########################################
+## Compiled cron schedules answer exactly what cron.next_time() does
+##
+testCommand cron_0 "python -m daflsim.cron '* *' '*/2 *' '35' '*/15' '10 */3' '0 2'" "^\#" n
+
+########################################
+## Actions parked on their inputs until data arrives (wake mode)
+##
+testCommand wake_0 "daflsim --end 20000 --summarize NSA --profile --action-mode wake $dcidot" "^\#" n
+
+########################################
+## Queue depth metrics.  The GOLD file is the old dict-based
+## queue_matrix.toMatrix run on the same samples as metrics.out, written
+## as graphite text.
+##
+testCommand metrics_0 "daflsim --end 10000 --metrics metrics.out $dcidot > /dev/null; python -m daflsim.queue_matrix metrics.out -" "^\#" n
+rm -f metrics.out
+
+########################################
+## Latency tracing, also through an action without inputs and a source
+## without output queues
+##
+testCommand latency_0 "daflsim --end 10000 --latency $dcidot" "^\#" n
+testCommand latency_1 "daflsim --end 3000 --profile --latency noinput.dot" "^\#" n
+
+########################################
+## Network links between hosts (bandwidth, latency, record size)
+##
+testCommand link_0 "daflsim --end 20000 --profile --summarize NSA --cfg link.cfg $dcidot" "^\#" n
+
+########################################
+## Queue capacity, with both policies for full queues
+##
+testCommand capacity_0 "daflsim --end 10000 --profile --cfg block.cfg slow.dot" "^\#" n
+testCommand capacity_1 "daflsim --end 10000 --profile --cfg dropold.cfg slow.dot" "^\#" n
+
+########################################
+## All-of join: inputs matched by key, read in place from their queues
+##
+testCommand join_0 "daflsim --end 10000 --profile join.dot" "^\#" n
+
+########################################
+## Failures, retries with backoff, and a queue for failed messages
+##
+testCommand fail_0 "daflsim --end 10000 --profile --cfg retry.cfg failing.dot" "^\#" n
+
+########################################
+## Trace replay.  Trace files are found next to the dot file, so the run
+## from the parent directory (trace_1) matches trace_0
+##
+testCommand trace_0 "daflsim --end 10000 --profile --latency trace.dot" "^\#" n
+testCommand trace_1 "cd ..; daflsim --end 10000 --profile --latency tests/trace.dot; cd tests" "^\#" n
+
+########################################
+## Binary event log, decoded
+##
+testCommand events_0 "daflsim --end 10000 --events events.bin join.dot > /dev/null; python -m daflsim.eventlog events.bin" "^\#" n
+rm -f events.bin
+
+########################################
+## Run until steady state: alone, replicated and swept
+##
+steady="--until-steady --precision 0.2 --batch 3600 --end 2000000"
+testCommand steady_0 "daflsim $steady --profile steady.dot" "^\#" n
+testCommand steady_1 "daflsim $steady --replications 2 --workers 1 steady.dot" "^\#" n
+testCommand steady_2 "daflsim $steady --sweep action_delay=5,30 --workers 1 steady.dot" "^\#" n
+
+########################################
+## Queueing network estimate, without simulating.  failing.dot has a
+## loop that drains (failed messages are resubmitted)
+##
+testCommand analytic_0 "daflsim --analytic $dcidot" "^\#" n
+testCommand analytic_1 "daflsim --analytic --sweep action_delay=5,60,600 $dcidot" "^\#" n
+testCommand analytic_2 "daflsim --analytic --cfg retry.cfg failing.dot" "^\#" n
+
+########################################
+## Static analysis of the graph, without simulating
+##
+testCommand analyze_0 "daflsim --analyze $dcidot" "^\#" n
+testCommand analyze_1 "daflsim --analyze --cfg cores.cfg $dcidot" "^\#" n
+
 
 ###########################################
 #! echo "WARNING: ignoring remainder of tests"